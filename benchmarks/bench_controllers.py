@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the hot paths of the AlbaEm2 controllers against the simulator.
+
+Usage: python -m benchmarks.bench_controllers [--output results.json]
+
+The results are written as JSON, one entry per measurement, so the runs of
+different releases can be compared.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from sardana import State
+from sardana.pool import AcqSynch
+
+import sardana_albaem
+from sardana_albaem.ctrl.Albaem2CoTiCtrl import Albaem2CoTiCtrl
+from sardana_albaem.ctrl.Albaem2OneDCtrl import Albaem2OneDCtrl
+from sardana_albaem.simulator import AlbaEm2Simulator
+
+CONTROLLERS = {'Albaem2CoTiCtrl': Albaem2CoTiCtrl,
+               'Albaem2OneDCtrl': Albaem2OneDCtrl}
+POINTS = [1000, 10000, 100000]
+
+
+def create(ctrl_class, sim):
+    props = {'AlbaEmHost': sim.host, 'Port': sim.port,
+             'ExtTriggerInput': 'DIO_1', 'UseAsyncio': False}
+    return ctrl_class('bench', props)
+
+
+def stats(name, ctrl_name, samples, unit='s', **extra):
+    result = {'name': name, 'controller': ctrl_name, 'unit': unit,
+              'n': len(samples), 'min': min(samples),
+              'median': statistics.median(samples),
+              'mean': statistics.mean(samples), 'max': max(samples)}
+    result.update(extra)
+    return result
+
+
+def wait_on(ctrl):
+    ctrl.StateAll()
+    while ctrl.StateOne(1)[0] == State.Moving:
+        ctrl.StateAll()
+
+
+def exchanges(ctrl):
+    return sum(stats.count for stats in ctrl.albaem.stats.commands.values())
+
+
+def bench_send_cmd(ctrl_name, ctrl, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ctrl.sendCmd('ACQU:STAT?')
+        samples.append(time.perf_counter() - t0)
+    return [stats('sendCmd_rtt', ctrl_name, samples)]
+
+
+def bench_load_one(ctrl_name, ctrl, repeat):
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    samples = []
+    for i in range(repeat):
+        # A different integration time every time, so nothing is cached
+        ctrl.albaem.invalidate()
+        t0 = time.perf_counter()
+        ctrl.LoadOne(1, 0.001 + i * 1e-6, 10, 0)
+        samples.append(time.perf_counter() - t0)
+    cached = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ctrl.LoadOne(1, 0.001, 10, 0)
+        cached.append(time.perf_counter() - t0)
+    return [stats('LoadOne', ctrl_name, samples),
+            stats('LoadOne_unchanged', ctrl_name, cached)]
+
+
+def bench_start_all(ctrl_name, ctrl, sim, repeat):
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.LoadOne(1, 0.001, 1000000, 0)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ctrl.StartAll()
+        samples.append(time.perf_counter() - t0)
+        ctrl.AbortOne(1)
+    return [stats('StartAll_to_moving', ctrl_name, samples)]
+
+
+def bench_read_all(ctrl_name, ctrl, sim, repeat):
+    results = []
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    # Measurements as binary blocks or as text
+    fmt = 'binary' if ctrl.albaem.binary else 'text'
+    for points in POINTS:
+        ctrl.PrepareOne(1, 0.001, points, 0, 1)
+        ctrl.LoadOne(1, 0.001, points, 0)
+        samples = []
+        for _ in range(repeat):
+            # As the Pool does for every channel, resets the read index
+            for axis in (1, 2):
+                ctrl.PreStartOne(axis, None)
+            ctrl.StartAll()
+            sim.model.complete()
+            wait_on(ctrl)
+            t0 = time.perf_counter()
+            ctrl.ReadAll()
+            ctrl.ReadOne(2)
+            samples.append(time.perf_counter() - t0)
+        results.append(stats('ReadAll', ctrl_name, samples, points=points,
+                             format=fmt))
+        results.append(stats('ReadAll_throughput', ctrl_name,
+                             [points / t for t in samples],
+                             unit='points/s', points=points, format=fmt))
+    return results
+
+
+def bench_count(ctrl_name, ctrl, repeat, itime=0.01):
+    """
+    Software triggered counts as done by ct: the overhead is the time of a
+    whole count above the integration time.
+    """
+    ctrl._synchronization = AcqSynch.SoftwareTrigger
+    ctrl.LoadOne(1, itime, 1, 0)
+    samples = []
+    round_trips = []
+    for _ in range(repeat):
+        ctrl.albaem.stats.reset()
+        t0 = time.perf_counter()
+        for axis in range(1, 6):
+            ctrl.PreStartOne(axis, None)
+        ctrl.StartAll()
+        started = exchanges(ctrl)
+        wait_on(ctrl)
+        polls = exchanges(ctrl) - started
+        ctrl.ReadAll()
+        for axis in range(1, 6):
+            ctrl.ReadOne(axis)
+        samples.append(time.perf_counter() - t0 - itime)
+        # The state polls depend on the polling period, not on the path
+        round_trips.append(exchanges(ctrl) - polls)
+    return [stats('count_overhead', ctrl_name, samples, itime=itime),
+            stats('count_round_trips', ctrl_name, round_trips,
+                  unit='round-trips', itime=itime)]
+
+
+def run(repeat):
+    results = []
+    with AlbaEm2Simulator(trigger_rate=1e6) as sim:
+        for ctrl_name, ctrl_class in sorted(CONTROLLERS.items()):
+            ctrl = create(ctrl_class, sim)
+            results += bench_send_cmd(ctrl_name, ctrl, repeat * 100)
+            results += bench_load_one(ctrl_name, ctrl, repeat * 10)
+            results += bench_start_all(ctrl_name, ctrl, sim, repeat)
+            results += bench_count(ctrl_name, ctrl, repeat * 10)
+            results += bench_read_all(ctrl_name, ctrl, sim, repeat)
+            ctrl.albaem.binary = False
+            results += bench_read_all(ctrl_name, ctrl, sim, repeat)
+            ctrl.albaem.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None,
+                        help='JSON file for the results, stdout by default')
+    args = parser.parse_args()
+
+    report = {
+        'version': sardana_albaem.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': run(args.repeat),
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""
+Compare the ACQU:MEAS? parser against the former eval based parsing.
+
+Usage: python -m benchmarks.bench_parser [--repeat N]
+"""
+
+import argparse
+import random
+import timeit
+
+from sardana_albaem.parsing import parse_measurements
+
+POINTS = [1000, 10000, 100000]
+
+
+def make_reply(points, channels=4):
+    chans = []
+    for chn in range(1, channels + 1):
+        values = ', '.join(repr(random.uniform(-1e-6, 1e-6))
+                           for _ in range(points))
+        chans.append("['CHAN{0:02d}', [{1}]]".format(chn, values))
+    return '[' + ', '.join(chans) + ']'
+
+
+def eval_parser(raw):
+    return [(name, [float(v) for v in values])
+            for name, values in eval(raw)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{0:>8} {1:>12} {2:>12} {3:>8}'.format('points', 'eval [s]',
+                                                 'parser [s]', 'speedup'))
+    for points in POINTS:
+        raw = make_reply(points)
+        t_eval = min(timeit.repeat(lambda: eval_parser(raw),
+                                   number=1, repeat=args.repeat))
+        t_parser = min(timeit.repeat(lambda: parse_measurements(raw),
+                                     number=1, repeat=args.repeat))
+        print('{0:>8} {1:>12.6f} {2:>12.6f} {3:>7.1f}x'.format(
+            points, t_eval, t_parser, t_eval / t_parser))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""
+asyncio client for many AlbaEm2 units sharing one event loop.
+
+:class:`AsyncAlbaEm2Client` speaks the SCPI protocol with coroutines. All
+the clients of a process run on a single event loop thread, so the
+synchronous classes on top of it can talk to many units concurrently:
+
+- :class:`AsyncAlbaEm2Transport`, a drop-in replacement of
+  :class:`~sardana_albaem.transport.AlbaEm2Transport` for the controllers.
+- :class:`AlbaEm2Group`, to send the same commands to many units at once,
+  e.g. ``group.send('ACQU:NDAT?')`` costs one round-trip for all of them.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from sardana_albaem.stats import TransportStats
+from sardana_albaem.transport import AlbaEm2Transport, is_idempotent, \
+    split_answers
+
+__all__ = ['AsyncAlbaEm2Client', 'AsyncAlbaEm2Transport', 'AlbaEm2Group',
+           'get_event_loop']
+
+# Biggest reply accepted by the stream reader, in bytes
+READ_LIMIT = 2 ** 28
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Return the event loop shared by all the clients, started if needed."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever,
+                                      name='AlbaEm2EventLoop')
+            thread.daemon = True
+            thread.start()
+        return _loop
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the shared event loop and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    return future.result(timeout)
+
+
+class AsyncAlbaEm2Client(object):
+    """
+    Coroutine based connection to an AlbaEm2 electrometer.
+
+    Same protocol as :class:`~sardana_albaem.transport.AlbaEm2Transport`:
+    commands are joined with ';', terminated with ';\\n' and, in case of a
+    failure, the connection is re-created and the idempotent commands are
+    sent once more.
+    """
+
+    def __init__(self, host, port, timeout=1, log=None, on_reconnect=None,
+                 stats=None):
+        self.address = (host, port)
+        self.timeout = timeout
+        self._log = log or logging.getLogger(__name__)
+        self._on_reconnect = on_reconnect
+        self.stats = stats or TransportStats(timeout)
+        self._connected = False
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def connect(self):
+        """Create a new connection to the device."""
+        await self.close()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(*self.address, limit=READ_LIMIT),
+            self.timeout)
+        if self._connected:
+            self.stats.reconnections += 1
+        self._connected = True
+        if self._on_reconnect is not None:
+            self._on_reconnect()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+            self._writer = None
+            self._reader = None
+
+    async def send(self, cmd, rw=True):
+        """Send a command and return its answer, see send_many."""
+        answers = await self.send_many([cmd], rw)
+        if not answers:
+            return None
+        return answers[-1]
+
+    async def send_many(self, cmds, rw=True, binary=False, expected=0):
+        """
+        Send a list of commands in a single write and collect the answers.
+
+        :param cmds: list of SCPI commands without terminator
+        :param rw: read the answers of the device
+        :param binary: the answer of the single command is a binary block,
+                       see :meth:`LineReader.read_block
+                       <sardana_albaem.transport.LineReader.read_block>`
+        :param expected: expected size of the answers in bytes
+        :return: list with one answer per command, None if the device closed
+                 the connection.
+        """
+        if not cmds:
+            return []
+        if self._lock is None:
+            # Created here so it belongs to the running event loop
+            self._lock = asyncio.Lock()
+        cmd = ';'.join(cmds)
+        raw = (cmd + ';\n').encode()
+        async with self._lock:
+            t0 = time.perf_counter()
+            attempts = 2 if is_idempotent(cmds) else 1
+            for attempt in range(attempts):
+                try:
+                    if self._writer is None:
+                        await self.connect()
+                    timeout = self.stats.timeout(cmds, expected)
+                    self._writer.write(raw)
+                    await asyncio.wait_for(self._writer.drain(), timeout)
+                    if not rw:
+                        self.stats.record(cmds, time.perf_counter() - t0,
+                                          len(raw), 0)
+                        return None
+                    if binary:
+                        read = self._read_block()
+                    else:
+                        read = self._read_answers(len(cmds))
+                    answers, received = await asyncio.wait_for(read, timeout)
+                    self.stats.record(cmds, time.perf_counter() - t0,
+                                      len(raw), received)
+                    return answers
+                except asyncio.TimeoutError:
+                    self._log.debug('Socket timeout with %s' % cmd)
+                    self.stats.record_timeout(cmds)
+                    await self.close()
+                except (OSError, ValueError) as e:
+                    # A reply that cannot be decoded leaves the stream out
+                    # of sync, like a broken connection
+                    self._log.debug('Socket error with %s: %s' % (cmd, e))
+                    await self.close()
+            msg = "Unable to communicate with AlbaEm2, try to " \
+                  "restart the Device"
+            raise RuntimeError(msg)
+
+    async def _read_answers(self, nb_answers):
+        answers = []
+        received = 0
+        while len(answers) < nb_answers:
+            try:
+                data = await self._reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError:
+                self._log.error('Connection closed by the device')
+                await self.close()
+                return None, received
+            received += len(data)
+            answers.extend(split_answers(data[:-1].decode()))
+        return answers, received
+
+    async def _read_block(self):
+        try:
+            head = await self._reader.readexactly(2)
+            if head[:1] != b'#':
+                if not head.endswith(b'\n'):
+                    head += await self._reader.readuntil(b'\n')
+                return split_answers(head[:-1].decode()), len(head)
+            ndigits = int(head[1:2])
+            size = int(await self._reader.readexactly(ndigits))
+            payload = await self._reader.readexactly(size)
+            tail = await self._reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError:
+            self._log.error('Connection closed by the device')
+            await self.close()
+            return None, 0
+        return [payload], 2 + ndigits + size + len(tail)
+
+
+class AsyncAlbaEm2Transport(AlbaEm2Transport):
+    """
+    Synchronous facade of :class:`AsyncAlbaEm2Client`.
+
+    It offers the same API as :class:`AlbaEm2Transport` but the commands are
+    executed on the shared event loop, where the connections to the other
+    units are served concurrently.
+    """
+
+    def connect(self):
+        if getattr(self, 'client', None) is None:
+            self.client = AsyncAlbaEm2Client(
+                self.ip_config[0], self.ip_config[1], self.timeout,
+                self._log, on_reconnect=self.invalidate, stats=self.stats)
+        run(self.client.connect())
+
+    def _disconnect(self):
+        if getattr(self, 'client', None) is not None:
+            run(self.client.close())
+
+    def _transfer(self, cmds, rw, binary, expected):
+        return run(self.client.send_many(cmds, rw, binary, expected))
+
+
+class AlbaEm2Group(object):
+    """
+    Many AlbaEm2 units commanded at once.
+
+    The commands are sent to all the units concurrently, so e.g. reading
+    ACQU:NDAT? or arming all of them costs a single round-trip.
+    """
+
+    def __init__(self, addresses, timeout=1, log=None):
+        """
+        :param addresses: list of (host, port) of the units
+        """
+        self.clients = [AsyncAlbaEm2Client(host, port, timeout, log)
+                        for host, port in addresses]
+
+    def send(self, cmd, rw=True):
+        """
+        Send a command to all the units.
+
+        :return: dictionary {(host, port): answer}
+        """
+        return self._gather([client.send(cmd, rw)
+                             for client in self.clients])
+
+    def send_many(self, cmds, rw=True):
+        """
+        Send a list of commands to all the units in a single write each.
+
+        :return: dictionary {(host, port): list of answers}
+        """
+        return self._gather([client.send_many(cmds, rw)
+                             for client in self.clients])
+
+    def close(self):
+        self._gather([client.close() for client in self.clients])
+
+    def _gather(self, coros):
+        async def gather():
+            return await asyncio.gather(*coros)
+        results = run(gather())
+        return dict(zip([client.address for client in self.clients],
+                        results))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Circuit breaker for the connections to the AlbaEm2 units."""
+
+import logging
+from threading import Event, Lock, Thread
+
+__all__ = ['CircuitBreaker', 'DeviceUnavailableError']
+
+# Delays between two health probes of a unit down, in seconds
+BACKOFF_MIN = 0.1
+BACKOFF_MAX = 10.0
+
+
+class DeviceUnavailableError(RuntimeError):
+    """The unit is known to be down, the command was not sent."""
+
+
+class CircuitBreaker(object):
+    """
+    Fail fast while a unit is down and restore it in the background.
+
+    The breaker is tripped when an exchange fails. From then on
+    :meth:`check` raises :class:`DeviceUnavailableError` without touching
+    the network, while a thread calls the probe with an exponential
+    backoff between BACKOFF_MIN and BACKOFF_MAX seconds. The breaker is
+    closed again as soon as the probe succeeds.
+
+    :param probe: callable reconnecting to the unit, it returns True if the
+                  unit answers
+    :param name: name of the unit for the messages
+    """
+
+    def __init__(self, probe, name='', backoff_min=BACKOFF_MIN,
+                 backoff_max=BACKOFF_MAX, log=None):
+        self._probe = probe
+        self.name = name
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._log = log or logging.getLogger(__name__)
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self.failures = 0
+        self.is_open = False
+
+    def check(self):
+        """Raise DeviceUnavailableError if the unit is known to be down."""
+        if self.is_open:
+            raise DeviceUnavailableError(
+                'AlbaEm2 %s is not reachable, reconnecting in the '
+                'background' % self.name)
+
+    def trip(self):
+        """Mark the unit as down and start probing it."""
+        with self._lock:
+            self.is_open = True
+            if self._thread is not None:
+                return
+            self._log.warning('AlbaEm2 %s is not reachable' % self.name)
+            self._stop.clear()
+            self._thread = Thread(target=self._run,
+                                  name='AlbaEm2HealthProbe')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop probing, e.g. when the connection is closed."""
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def delay(self):
+        """Time before the next probe, in seconds."""
+        return min(self.backoff_max,
+                   self.backoff_min * 2 ** max(0, self.failures - 1))
+
+    def _run(self):
+        self.failures = 1
+        while not self._stop.wait(self.delay()):
+            try:
+                alive = self._probe()
+            except Exception as e:
+                self._log.debug('Health probe of %s failed: %s' %
+                                (self.name, e))
+                alive = False
+            if alive:
+                self._log.info('AlbaEm2 %s reachable again' % self.name)
+                with self._lock:
+                    self.failures = 0
+                    self.is_open = False
+                    self._thread = None
+                return
+            self.failures += 1
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Behaviour shared by the AlbaEm2 controllers."""
+
+import json
+
+from sardana_albaem.parsing import parse_switch
+from sardana_albaem.tracing import traced
+
+__all__ = ['AlbaEm2ControllerMixin']
+
+
+class AlbaEm2ControllerMixin(object):
+    """
+    Commands of the AlbaEm2 controllers sent with SendToController.
+
+    The controllers have the transport in :attr:`albaem` and the state
+    predictor in :attr:`_predictor`. The axis 1 is the time channel, the
+    axes 2 to 5 are the channels 1 to 4 of the device.
+    """
+
+    @traced
+    def SendToCtrl(self, stream):
+        command, _, args = stream.strip().partition(' ')
+        command = command.lower()
+        if command == 'resetstatistics':
+            self.albaem.stats.reset()
+            self._predictor.reset()
+            return ''
+        if command == 'refreshsettings':
+            self.albaem.settings.invalidate()
+            self.albaem.settings.get()
+            return ''
+        if command == 'setranges':
+            # e.g. 'SetRanges {"2": "1nA", "3": "10nA"}'
+            changes = self._write_channels('RANGE', json.loads(args), str)
+            return json.dumps(changes)
+        if command == 'setinversions':
+            changes = self._write_channels('INVE', json.loads(args), int,
+                                           parse_switch)
+            return json.dumps(changes)
+        raise ValueError('Unknown command: %s' % stream)
+
+    def _write_channels(self, setting, values, convert, parse=None):
+        """
+        Write a setting of many axes and read it back in a single exchange.
+
+        :param setting: 'RANGE' or 'INVE'
+        :param values: dictionary {axis: value}, the axes may be strings
+        :param convert: conversion of the values to write, e.g. int
+        :param parse: conversion of the answers of the device
+        :return: dictionary {axis: [old value, new value]}
+        """
+        values = dict((int(axis), value) for axis, value in values.items())
+        if 1 in values:
+            raise ValueError('The axis 1 does not use the extra attributes')
+        changes = self.albaem.write_channels(
+            setting, dict((axis - 1, convert(value))
+                          for axis, value in values.items()))
+        if parse is None:
+            return dict((chn + 1, change) for chn, change in changes.items())
+        return dict((chn + 1, [parse(value) for value in change])
+                    for chn, change in changes.items())
@@ -1,14 +1,24 @@
 #!/usr/bin/env python
-import socket
+import json
 import time
-from threading import Lock
+
+import numpy as np
 
 from sardana import State, DataAccess
 from sardana.pool import AcqSynch
 from sardana.pool.controller import CounterTimerController, Type, Access, \
-    Description, Memorize, Memorized, NotMemorized
+    Description, Memorize, Memorized, NotMemorized, DefaultValue
 from sardana.sardanavalue import SardanaValue
 
+from sardana_albaem.aio import AsyncAlbaEm2Transport
+from sardana_albaem.breaker import DeviceUnavailableError
+from sardana_albaem.controller import AlbaEm2ControllerMixin
+from sardana_albaem.formula import Formula
+from sardana_albaem.parsing import channel_index, parse_switch
+from sardana_albaem.polling import START_TIMEOUT, StatePredictor, wait_for
+from sardana_albaem.reader import AcquisitionReader
+from sardana_albaem.transport import MAX_CHUNK_POINTS, AlbaEm2Transport
+
 __all__ = ['Albaem2CoTiCtrl']
 
 TRIGGER_INPUTS = {'DIO_1': 0, 'DIO_2': 1, 'DIO_3': 2, 'DIO_4': 3,
@@ -17,7 +27,21 @@ TRIGGER_INPUTS = {'DIO_1': 0, 'DIO_2': 1, 'DIO_3': 2, 'DIO_4': 3,
                   'DIFF_IO_7': 10, 'DIFF_IO_8': 11, 'DIFF_IO_9': 12}
 
 
-class Albaem2CoTiCtrl(CounterTimerController):
+def step_statistics(values, points_per_step):
+    """
+    Reduce the points of every step to their statistics.
+
+    :param values: numpy array with a whole number of steps
+    :param points_per_step: number of points of every step
+    :return: numpy arrays with the mean, standard deviation, minimum and
+             maximum of every step.
+    """
+    steps = values.reshape(-1, points_per_step)
+    return (steps.mean(axis=1), steps.std(axis=1), steps.min(axis=1),
+            steps.max(axis=1))
+
+
+class Albaem2CoTiCtrl(AlbaEm2ControllerMixin, CounterTimerController):
     MaxDevice = 5
 
     ctrl_properties = {
@@ -33,6 +57,12 @@ class Albaem2CoTiCtrl(CounterTimerController):
             Description: 'ExtTriggerInput',
             Type: str
         },
+        'UseAsyncio': {
+            Description: 'Talk to the device from the event loop shared by '
+                         'all the AlbaEm2 controllers of the Pool',
+            Type: bool,
+            DefaultValue: False,
+        },
     }
 
     ctrl_attributes = {
@@ -43,6 +73,83 @@ class Albaem2CoTiCtrl(CounterTimerController):
             Access: DataAccess.ReadWrite,
             Memorize: Memorized
         },
+        'MaxChunkPoints': {
+            Type: int,
+            Description: 'Maximum number of points read per ACQU:MEAS? '
+                         'command. 0 reads all the pending points at once',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
+        'BackgroundRead': {
+            Type: bool,
+            Description: 'Drain the device buffer from a background thread '
+                         'in hardware synchronized acquisitions',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
+        'BinaryTransfer': {
+            Type: bool,
+            Description: 'Read the measurements as binary blocks when the '
+                         'firmware supports them',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
+        'Statistics': {
+            Type: str,
+            Description: 'JSON with the latency histogram per command type '
+                         'and the bytes transferred. SendToCtrl '
+                         '"ResetStatistics" clears it',
+            Access: DataAccess.ReadOnly
+        },
+        'Timeouts': {
+            Type: int,
+            Description: 'Number of timeouts talking to the device',
+            Access: DataAccess.ReadOnly
+        },
+        'Reconnections': {
+            Type: int,
+            Description: 'Number of connections re-created to the device',
+            Access: DataAccess.ReadOnly
+        },
+        'StatePollingInterval': {
+            Type: float,
+            Description: 'Longest time in seconds without asking the state '
+                         'to the device while the acquisition cannot be '
+                         'over yet. 0 asks it on every poll',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
+        'InstantCurrents': {
+            Type: (float,),
+            Description: 'Instant currents of the four channels',
+            Access: DataAccess.ReadOnly
+        },
+        'InstantCurrentPeriod': {
+            Type: float,
+            Description: 'Time in seconds the instant currents are served '
+                         'from the last snapshot of the four channels. 0 '
+                         'reads them on every request',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
+        'SettingsRefreshPeriod': {
+            Type: float,
+            Description: 'Time in seconds the Range, Inversion and '
+                         'AcquisitionMode reads are served from the values '
+                         'written or read in bulk. SendToCtrl '
+                         '"RefreshSettings" reads them again',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
+        'PointsPerStep': {
+            Type: int,
+            Description: 'Hardware triggers per step in hardware '
+                         'synchronized acquisitions. The value of a step is '
+                         'the mean of its points, see StepStdDev, StepMin '
+                         'and StepMax',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized
+        },
     }
 
     axis_attributes = {
@@ -72,6 +179,27 @@ class Albaem2CoTiCtrl(CounterTimerController):
                              'e.g. "(value/10)*1e-06"',
                 Access: DataAccess.ReadWrite
             },
+        "StepStdDev": {
+            Type: float,
+            Description: 'Standard deviation of the points of the last '
+                         'step read, with PointsPerStep > 1',
+            Memorize: NotMemorized,
+            Access: DataAccess.ReadOnly
+        },
+        "StepMin": {
+            Type: float,
+            Description: 'Minimum of the points of the last step read, with '
+                         'PointsPerStep > 1',
+            Memorize: NotMemorized,
+            Access: DataAccess.ReadOnly
+        },
+        "StepMax": {
+            Type: float,
+            Description: 'Maximum of the points of the last step read, with '
+                         'PointsPerStep > 1',
+            Memorize: NotMemorized,
+            Access: DataAccess.ReadOnly
+        },
     }
 
     def __init__(self, inst, props, *args, **kwargs):
@@ -80,17 +208,33 @@ class Albaem2CoTiCtrl(CounterTimerController):
         msg = "__init__(%s, %s): Entering...", repr(inst), repr(props)
         self._log.debug(msg)
 
-        self.ip_config = (self.AlbaEmHost, self.Port)
-        self.albaem_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.albaem_socket.settimeout(1)
-        self.albaem_socket.connect(self.ip_config)
+        if self.UseAsyncio:
+            transport_class = AsyncAlbaEm2Transport
+        else:
+            transport_class = AlbaEm2Transport
+        self.albaem = transport_class(self.AlbaEmHost, self.Port,
+                                      log=self._log)
         self.index = 0
         self.master = None
         self._latency_time = 0.001  # In fact, it is just 320us
         self._repetitions = 0
-        self.formulas = {1: 'value', 2: 'value', 3: 'value', 4:'value'}
-
-        self.lock = Lock()
+        self._max_chunk_points = MAX_CHUNK_POINTS
+        self._background_read = False
+        self._reader = AcquisitionReader(self.albaem, log=self._log)
+        self._reading_in_background = False
+        self.formulas = {1: Formula('value'), 2: Formula('value'),
+                         3: Formula('value'), 4: Formula('value')}
+
+        # Several points per step: triggers expected by the device, points
+        # of an incomplete step per channel and statistics of the last step
+        self._points_per_step = 1
+        self._nb_triggers = 0
+        self._pending = {}
+        self.step_stats = {}
+        # Points acquired according to the last state reading
+        self._ndat = None
+        # Answers the state polls while the acquisition cannot be over
+        self._predictor = StatePredictor()
 
     def AddDevice(self, axis):
         """Add device to controller."""
@@ -102,13 +246,35 @@ class Albaem2CoTiCtrl(CounterTimerController):
     def DeleteDevice(self, axis):
         """Delete device from the controller."""
         self._log.debug("DeleteDevice(%d): Entering...", axis)
-        # self.albaem_socket.close()
+        # self.albaem.close()
 
     def StateAll(self):
         """Read state of all axis."""
         # self._log.debug("StateAll(): Entering...")
-        state = self.sendCmd('ACQU:STAT?')
+        if not self._predictor.needs_query():
+            # The acquisition cannot be over yet, it is still moving
+            return
+        try:
+            # The number of points comes in the same round-trip, so the
+            # next ReadAll does not need to ask it
+            answers = self.albaem.send_many(['ACQU:STAT?', 'ACQU:NDAT?'])
+        except DeviceUnavailableError as e:
+            # Known to be down, reported without waiting for any timeout
+            self.state = State.Fault
+            self.status = str(e)
+            return
+        # A failed command may add answers, the last two are the queries
+        state, ndat = answers[-2:] if answers else (None, None)
+        self._set_state(state, ndat)
+        self._predictor.queried(self.state == State.Moving, self._ndat)
+
+        # Once the acquisition is over the reader takes the last points, so
+        # they are available for the next ReadAll
+        if self.state != State.Moving and self._reader.is_alive():
+            self._reader.finish()
+        # self._log.debug("StateAll(): %r %r" %(self.state, self.status))
 
+    def _set_state(self, state, ndat=None):
         if state in ['STATE_ACQUIRING', 'STATE_RUNNING']:
             self.state = State.Moving
 
@@ -120,10 +286,13 @@ class Albaem2CoTiCtrl(CounterTimerController):
 
         else:
             self.state = State.Fault
-            self._log.debug("StateAll(): %r %r UNKNWON STATE: "
-                            "%s" % self.state, self.status, state)
+            self._log.debug("StateAll(): %r UNKNOWN STATE: "
+                            "%s" % (self.state, state))
         self.status = state
-        # self._log.debug("StateAll(): %r %r" %(self.state, self.status))
+        try:
+            self._ndat = int(ndat)
+        except (TypeError, ValueError):
+            self._ndat = None
 
     def StateOne(self, axis):
         """Read state of one axis."""
@@ -144,7 +313,7 @@ class Albaem2CoTiCtrl(CounterTimerController):
         if val < 0.1:   # minimum integration time 
             self._log.debug("The minimum integration time is 0.1 ms")
             val = 0.1
-        self.sendCmd('ACQU:TIME %r' % val)
+        cmds = ['ACQU:TIME %r' % val]
 
         if self._synchronization in [AcqSynch.SoftwareTrigger,
                                      AcqSynch.SoftwareGate]:
@@ -163,24 +332,28 @@ class Albaem2CoTiCtrl(CounterTimerController):
             #                 "to HardwareGate")
             source = 'GATE'
             self._repetitions = repetitions
-        self.sendCmd('TRIG:MODE %s' % source)
+        cmds.append('TRIG:MODE %s' % source)
+        self._nb_triggers = self._repetitions
         if self._synchronization in [AcqSynch.HardwareTrigger,
                                      AcqSynch.HardwareGate]:
-            self.sendCmd('TRIG:INPU %s' % self.ExtTriggerInput)
+            cmds.append('TRIG:INPU %s' % self.ExtTriggerInput)
+            self._nb_triggers *= self._points_per_step
         # Set Number of Triggers
-        self.sendCmd('ACQU:NTRI %r' % self._repetitions)
+        cmds.append('ACQU:NTRI %r' % self._nb_triggers)
+        # THIS CONTROLLER IS NOT YET READY FOR TIMESTAMP DATA
+        cmds.append('TMST 0')
+        # The whole configuration is sent in a single round-trip and only
+        # the settings which changed since the last LoadOne are written
+        self.albaem.configure(cmds)
 
     def PreStartOne(self, axis, value=None):
         # self._log.debug("PreStartOneCT(%d): Entering...", axis)
         if axis != 1:
             self.index = 0
 
-        #Check if the communication is stable before start
-        state = self.sendCmd('ACQU:STAT?')
-        if state is None:
-            return False
-
-        return True
+        # The communication is checked by the start itself, only a unit
+        # known to be down is refused here, without any round-trip
+        return not self.albaem.breaker.is_open
 
     def StartAll(self):
         """
@@ -196,160 +369,141 @@ class Albaem2CoTiCtrl(CounterTimerController):
             # TRIG:SWSEt
             cmd += ' SWTRIG'
 
-        self.sendCmd(cmd)
-        # THIS PROTECTION HAS TO BE REVIEWED
-        # FAST INTEGRATION TIMES MAY RAISE WRONG EXCEPTIONS
-        # e.g. 10ms ACQTIME -> self.state MAY BE NOT MOVING BECAUSE
-        # FINISHED, NOT FAILED
-        self.StateAll()
-        t0 = time.time()
-        while (self.state != State.Moving):
-            if time.time() - t0 > 3:
-                raise Exception('The HW did not start the acquisition')
-            self.StateAll()
+        self._reader.stop()
+        self._reading_in_background = False
+        self._pending = {}
+        self._predictor.disarm()
+        start = time.monotonic()
+        # The start and the state in a single round-trip. A short count may
+        # be over before the state is read, it is started if all the
+        # triggers were already acquired
+        answers = self.albaem.send_many([cmd, 'ACQU:STAT?', 'ACQU:NDAT?'])
+        state, ndat = answers[-2:] if answers else (None, None)
+        self._set_state(state, ndat)
+        if not (self._started() or wait_for(self._poll_started,
+                                            START_TIMEOUT)):
+            raise Exception('The HW did not start the acquisition')
+        if self.state == State.Moving:
+            # Every trigger lasts at least the integration time, the gates
+            # last what the hardware decides
+            itime = 0 if self._synchronization == AcqSynch.HardwareGate \
+                else self.itime
+            self._predictor.arm(start, itime, self._nb_triggers)
+
+        if self._background_read and self._synchronization in [
+                AcqSynch.HardwareTrigger, AcqSynch.HardwareGate]:
+            self._reader.chunk_size = self._max_chunk_points
+            self._reader.start(self._nb_triggers)
+            self._reading_in_background = True
         return True
 
     def ReadAll(self):
         # self._log.debug("ReadAll(): Entering...")
         # TODO Change the ACQU:MEAS command by CHAN:CURR
-        data_ready = int(self.sendCmd('ACQU:NDAT?'))
         self.new_data = []
         try:
-            if self.index < data_ready:
-                data_len = data_ready - self.index
-                # THIS CONTROLLER IS NOT YET READY FOR TIMESTAMP DATA
-                self.sendCmd('TMST 0')
-
-                msg = 'ACQU:MEAS? %r,%r' % (self.index - 1, data_len)
-                raw_data = self.sendCmd(msg)
-
-                data = eval(raw_data)
-                axis = 1
+            if self._reading_in_background:
+                # Points already drained by the reader thread
+                data = self._reader.pop()
+            else:
+                data = self._read_new_points()
+            if data:
+                points = self._step_points()
+                # The time channel is only built if it is read, unless the
+                # device sent the duration of every point
+                self.new_data = [None] * 5
                 for chn_name, values in data:
-
-                    # Apply the formula for each value
-                    formula = self.formulas[axis]
-                    formula = formula.lower()
-                    values_formula = [eval(formula, {'value': val}) for val
-                                      in values]
-                    self.new_data.append(values_formula)
-                    axis +=1
-                time_data = [self.itime] * len(self.new_data[0])
-                self.new_data.insert(0, time_data)
-                if self._repetitions != 1:
-                    self.index += len(time_data)
+                    axis = channel_index(chn_name)
+                    if axis > 0:
+                        # Apply the formula to all the values at once
+                        values = self.formulas[axis](values)
+                    if points > 1:
+                        values = self._reduce_steps(axis, values, points)
+                        if axis == 0:
+                            # Duration of the whole step
+                            values = values * points
+                    self.new_data[axis] = values
 
         except Exception as e:
             raise Exception("ReadAll error: %s: " + str(e))
 
+    def _poll_started(self):
+        self.StateAll()
+        return self._started()
+
+    def _started(self):
+        return self.state == State.Moving or (
+            self._ndat is not None and 0 < self._nb_triggers <= self._ndat)
+
+    def _read_new_points(self):
+        # Number of points read by the last StateAll, asked only if missing
+        data_ready, self._ndat = self._ndat, None
+        if data_ready is None:
+            data_ready = int(self.sendCmd('ACQU:NDAT?'))
+            self._predictor.progress(data_ready)
+        if self.index >= data_ready:
+            return []
+        data_len = data_ready - self.index
+        # Only whole steps are read
+        data_len -= data_len % self._step_points()
+        if data_len == 0:
+            return []
+        data = self.albaem.read_measurements(self.index, data_len,
+                                             self._max_chunk_points)
+        if self._repetitions != 1:
+            self.index += data_len
+        return data
+
+    def _step_points(self):
+        if self._synchronization in [AcqSynch.HardwareTrigger,
+                                     AcqSynch.HardwareGate]:
+            return self._points_per_step
+        return 1
+
+    def _reduce_steps(self, chn, values, points):
+        # The points of an incomplete step wait for the next ReadAll
+        pending = self._pending.get(chn)
+        if pending is not None and len(pending) > 0:
+            values = np.concatenate((pending, values))
+        complete = len(values) - len(values) % points
+        self._pending[chn] = values[complete:]
+        mean, std, vmin, vmax = step_statistics(values[:complete], points)
+        if complete > 0:
+            self.step_stats[chn] = (std[-1], vmin[-1], vmax[-1])
+        return mean
+
     def ReadOne(self, axis):
         # self._log.debug("ReadOne(%d): Entering...", axis)
         if len(self.new_data) == 0:
             return []
 
+        if axis == 1:
+            values = self._time_data()
+        else:
+            values = self.new_data[axis - 1]
         if self._synchronization in [AcqSynch.SoftwareTrigger,
                                      AcqSynch.SoftwareGate]:
-            return SardanaValue(self.new_data[axis - 1][0])
+            return SardanaValue(values[0])
         else:
-            val = self.new_data[axis - 1]
-            return val
+            return values
+
+    def _time_data(self):
+        if self.new_data[0] is not None:
+            return self.new_data[0]
+        # The integration time of every step, the sum of its points as for
+        # the durations sent by the device, without allocating them
+        return np.broadcast_to(float(self.itime * self._step_points()),
+                               (len(self.new_data[1]),))
 
     def AbortOne(self, axis):
         # self._log.debug("AbortOne(%d): Entering...", axis)
+        self._reader.stop()
+        self._predictor.disarm()
         self.sendCmd('ACQU:STOP')
 
-    def sendCmd(self, cmd, rw=True, size=8096):
-        with self.lock:
-            cmd += ';\n'
-
-            # Protection in case of reconnect the device in the network.
-            # It send the command and in case of broken socket it creates a
-            # new one.
-            retries = 2
-            for i in range(retries):
-                try:
-                    self.albaem_socket.sendall(cmd.encode())
-                    break
-                except socket.timeout:
-                    self._log.debug(
-                        'Socket timeout! reconnecting and commanding '
-                        'again %s' % cmd)
-                    self.albaem_socket = socket.socket(
-                        socket.AF_INET, socket.SOCK_STREAM)
-                    self.albaem_socket.settimeout(1)
-                    self.albaem_socket.connect(self.ip_config)
-            if rw:
-                # WARNING...
-                # socket.recv(size) IS NEVER ENOUGH TO RECEIVE DATA !!!
-                # you should know by the protocol either:
-                # the length of data to be received
-                # or
-                # wait until a special end-of-transfer control
-                # In this case: while not '\r' in data:
-                #                 receive more data...
-                ################################################
-                # AS IT IS SAID IN https://docs.python.org/3/howto/sockets.html
-                # SECTION "3 Using a Socket"
-                #
-                # A protocol like HTTP uses a socket for only one
-                # transfer. The client sends a request, the reads a
-                # reply. That's it. The socket is discarded. This
-                # means that a client can detect the end of the reply
-                # by receiving 0 bytes.
-                #
-                # But if you plan to reuse your socket for further
-                # transfers, you need to realize that there is no
-                # "EOT" (End of Transfer) on a socket. I repeat: if a
-                # socket send or recv returns after handling 0 bytes,
-                # the connection has been broken. If the connection
-                # has not been broken, you may wait on a recv forever,
-                # because the socket will not tell you that there's
-                # nothing more to read (for now). Now if you think
-                # about that a bit, you'll come to realize a
-                # fundamental truth of sockets: messages must either
-                # be fixed length (yuck), or be delimited (shrug), or
-                # indicate how long they are (much better), or end by
-                # shutting down the connection. The choice is entirely
-                # yours, (but some ways are righter than others).
-                ################################################
-                data = ""
-                acquired = False
-                while True:
-                    # SOME TIMEOUTS OCCUR WHEN USING THE WEBPAGE
-                    retries = 5
-                    for i in range(retries):
-                        try:
-                            data += self.albaem_socket.recv(size).decode()
-                            acquired = True
-                            break
-                        except socket.timeout:
-                            self._log.debug(
-                                'Socket timeout! Reading... from  %s '
-                                'command' %cmd[:-2])
-                            self.albaem_socket = socket.socket(
-                                socket.AF_INET, socket.SOCK_STREAM)
-                            self.albaem_socket.settimeout(1)
-                            self.albaem_socket.connect(self.ip_config)
-                            self.albaem_socket.sendall(cmd.encode())
-                            pass
-
-                    if acquired == False:
-                        msg = "Unable to communicate with AlbaEm2, try to " \
-                              "restart the Device"
-                        raise RuntimeError(msg)
-                    try:
-                        if data[-1] == '\n':
-                            break
-                    except Exception as e:
-                        self._log.error(e)
-                        return None
-
-                # NOTE: EM MAY ANSWER WITH MULTIPLE ANSWERS IN CASE OF AN
-                # EXCEPTION
-                # SIMPLY GET THE LAST ONE
-                if data.count(';') > 1:
-                    data = data.rsplit(';')[-2:]
-                return data[:-2]
+    def sendCmd(self, cmd, rw=True):
+        return self.albaem.send(cmd, rw)
+
 
 ###############################################################################
 #                Axis Extra Attribute Methods
@@ -365,18 +519,18 @@ class Albaem2CoTiCtrl(CounterTimerController):
         axis -= 1
         if name == "range":
             cmd = 'CHAN{0:02d}:CABO:RANGE?'.format(axis)
-            return self.sendCmd(cmd)
+            return self.albaem.setting(cmd)
         elif name == 'inversion':
             cmd = 'CHAN{0:02d}:CABO:INVE?'.format(axis)
-            val = self.sendCmd(cmd)
-            if val.lower() == 'off':
-                ret = False
-            elif val.lower() == 'on':
-                ret = True
-            return ret
+            return parse_switch(self.albaem.setting(cmd))
         elif name == 'instantcurrent':
-            cmd = 'CHAN{0:02d}:INSCurrent?'.format(axis)
-            return eval(self.sendCmd(cmd))
+            return self.albaem.instant_currents.get()[axis - 1]
+        elif name == 'formula':
+            return self.formulas[axis].expression
+        elif name in ('stepstddev', 'stepmin', 'stepmax'):
+            stats = self.step_stats.get(axis, (np.nan, np.nan, np.nan))
+            idx = ('stepstddev', 'stepmin', 'stepmax').index(name)
+            return float(stats[idx])
 
     def SetAxisExtraPar(self, axis, name, value):
         if axis == 1:
@@ -390,6 +544,9 @@ class Albaem2CoTiCtrl(CounterTimerController):
         elif name == 'inversion':
             cmd = 'CHAN{0:02d}:CABO:INVE {1}'.format(axis, int(value))
             self.sendCmd(cmd)
+        elif name == 'formula':
+            # Validated and compiled once, applied on every ReadAll
+            self.formulas[axis] = Formula(value)
 
 
 ###############################################################################
@@ -400,13 +557,51 @@ class Albaem2CoTiCtrl(CounterTimerController):
         param = parameter.lower()
         if param == 'acquisitionmode':
             self.sendCmd('ACQU:MODE %s' % value)
+        elif param == 'maxchunkpoints':
+            self._max_chunk_points = value
+        elif param == 'backgroundread':
+            self._background_read = value
+        elif param == 'binarytransfer':
+            self.albaem.binary = value
+        elif param == 'pointsperstep':
+            self._points_per_step = value
+        elif param == 'statepollinginterval':
+            self._predictor.max_interval = value
+        elif param == 'instantcurrentperiod':
+            self.albaem.instant_currents.period = value
+        elif param == 'settingsrefreshperiod':
+            self.albaem.settings.period = value
         else:
             CounterTimerController.SetCtrlPar(self, parameter, value)
 
     def GetCtrlPar(self, parameter):
         param = parameter.lower()
         if param == 'acquisitionmode':
-            value = self.sendCmd('ACQU:MODE?')
+            value = self.albaem.setting('ACQU:MODE?')
+        elif param == 'maxchunkpoints':
+            value = self._max_chunk_points
+        elif param == 'backgroundread':
+            value = self._background_read
+        elif param == 'binarytransfer':
+            value = self.albaem.binary
+        elif param == 'pointsperstep':
+            value = self._points_per_step
+        elif param == 'statepollinginterval':
+            value = self._predictor.max_interval
+        elif param == 'instantcurrents':
+            value = self.albaem.instant_currents.get()
+        elif param == 'instantcurrentperiod':
+            value = self.albaem.instant_currents.period
+        elif param == 'settingsrefreshperiod':
+            value = self.albaem.settings.period
+        elif param == 'statistics':
+            summary = self.albaem.stats.summary()
+            summary['state_polls'] = self._predictor.summary()
+            value = json.dumps(summary)
+        elif param == 'timeouts':
+            value = self.albaem.stats.timeouts
+        elif param == 'reconnections':
+            value = self.albaem.stats.reconnections
         else:
             value = CounterTimerController.GetCtrlPar(self, parameter)
         return value
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
-import socket
+import json
 import time
 import datetime
-from threading import Lock
+
+import numpy as np
 
 from sardana import State, DataAccess
 from sardana.pool import AcqSynch
@@ -12,19 +13,21 @@ from sardana.sardanavalue import SardanaValue
 from functools import wraps, partial
 import six
 
-__all__ = ['Albaem2OneDCtrl']
+from sardana_albaem.aio import AsyncAlbaEm2Transport
+from sardana_albaem.breaker import DeviceUnavailableError
+from sardana_albaem.controller import AlbaEm2ControllerMixin
+from sardana_albaem.formula import Formula
+from sardana_albaem.parsing import channel_index, parse_switch
+from sardana_albaem.polling import START_TIMEOUT, StatePredictor, wait_for
+from sardana_albaem.reader import AcquisitionReader
+from sardana_albaem.tracing import Tracer, traced
+from sardana_albaem.transport import MAX_CHUNK_POINTS, AlbaEm2Transport
 
-def debug_it(func):
-    @wraps(func)
-    def wrapper(self, *args, **kwargs):
+__all__ = ['Albaem2OneDCtrl']
 
-        self._log.debug("Entering {} with args={}, kwargs={}".format(
-            func.__name__, args, kwargs))
-        output = func(self, *args, **kwargs)
-        self._log.debug("Leaving without error {} with output {}".format(func.__name__, output))
-        return output
-    return wrapper
 
+# Types of the spectra
+DATA_TYPES = {'float64': np.float64, 'float32': np.float32}
 
 def handle_error(func=None, msg="Error with Albaem2OneDCtrl"):
     if func is None:
@@ -39,7 +42,7 @@ def handle_error(func=None, msg="Error with Albaem2OneDCtrl"):
         return wrapper
 
 
-class Albaem2OneDCtrl(OneDController):
+class Albaem2OneDCtrl(AlbaEm2ControllerMixin, OneDController):
     MaxDevice = 5
 
     ctrl_properties = {
@@ -56,6 +59,12 @@ class Albaem2OneDCtrl(OneDController):
             Type: str,
             DefaultValue: "TRIGGER_IN",
         },
+        'UseAsyncio': {
+            Description: 'Talk to the device from the event loop shared by '
+                         'all the AlbaEm2 controllers of the Pool',
+            Type: bool,
+            DefaultValue: False,
+        },
     }
 
     ctrl_attributes = {
@@ -77,6 +86,125 @@ class Albaem2OneDCtrl(OneDController):
             FGet: "get_PointsPerStep",
             FSet: "set_PointsPerStep"
         },
+        'IncrementalRead': {
+            Type: bool,
+            Description: "Read only the new points on each ReadAll and \
+                          return them as spectra of PointsPerStep points. \
+                          Only applicable for hardware synchronization.",
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_IncrementalRead",
+            FSet: "set_IncrementalRead"
+        },
+        'MaxChunkPoints': {
+            Type: int,
+            Description: 'Maximum number of points read per ACQU:MEAS? '
+                         'command. 0 reads all the pending points at once',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_MaxChunkPoints",
+            FSet: "set_MaxChunkPoints"
+        },
+        'BackgroundRead': {
+            Type: bool,
+            Description: 'Drain the device buffer from a background thread '
+                         'in hardware synchronized acquisitions',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_BackgroundRead",
+            FSet: "set_BackgroundRead"
+        },
+        'BinaryTransfer': {
+            Type: bool,
+            Description: 'Read the measurements as binary blocks when the '
+                         'firmware supports them',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_BinaryTransfer",
+            FSet: "set_BinaryTransfer"
+        },
+        'DataType': {
+            Type: str,
+            Description: 'Type of the spectra values: float64 or float32',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_DataType",
+            FSet: "set_DataType"
+        },
+        'Statistics': {
+            Type: str,
+            Description: 'JSON with the latency histogram per command type '
+                         'and the bytes transferred. SendToCtrl '
+                         '"ResetStatistics" clears it',
+            Access: DataAccess.ReadOnly,
+            FGet: "get_Statistics"
+        },
+        'Timeouts': {
+            Type: int,
+            Description: 'Number of timeouts talking to the device',
+            Access: DataAccess.ReadOnly,
+            FGet: "get_Timeouts"
+        },
+        'Reconnections': {
+            Type: int,
+            Description: 'Number of connections re-created to the device',
+            Access: DataAccess.ReadOnly,
+            FGet: "get_Reconnections"
+        },
+        'StatePollingInterval': {
+            Type: float,
+            Description: 'Longest time in seconds without asking the state '
+                         'to the device while the acquisition cannot be '
+                         'over yet. 0 asks it on every poll',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_StatePollingInterval",
+            FSet: "set_StatePollingInterval"
+        },
+        'InstantCurrents': {
+            Type: (float,),
+            Description: 'Instant currents of the four channels',
+            Access: DataAccess.ReadOnly,
+            FGet: "get_InstantCurrents"
+        },
+        'InstantCurrentPeriod': {
+            Type: float,
+            Description: 'Time in seconds the instant currents are served '
+                         'from the last snapshot of the four channels. 0 '
+                         'reads them on every request',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_InstantCurrentPeriod",
+            FSet: "set_InstantCurrentPeriod"
+        },
+        'SettingsRefreshPeriod': {
+            Type: float,
+            Description: 'Time in seconds the Range, Inversion and '
+                         'AcquisitionMode reads are served from the values '
+                         'written or read in bulk. SendToCtrl '
+                         '"RefreshSettings" reads them again',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_SettingsRefreshPeriod",
+            FSet: "set_SettingsRefreshPeriod"
+        },
+        'Tracing': {
+            Type: bool,
+            Description: 'Log the calls of the controller methods with '
+                         'the debug level',
+            Access: DataAccess.ReadWrite,
+            Memorize: NotMemorized,
+            FGet: "get_Tracing",
+            FSet: "set_Tracing"
+        },
+        'TracingSampling': {
+            Type: int,
+            Description: 'Log one every N calls of each method',
+            Access: DataAccess.ReadWrite,
+            Memorize: Memorized,
+            FGet: "get_TracingSampling",
+            FSet: "set_TracingSampling"
+        },
     }
 
     axis_attributes = {
@@ -108,7 +236,9 @@ class Albaem2OneDCtrl(OneDController):
             Type: str,
             Description: 'The formula to get the real value.\n '
                             'e.g. "(value/10)*1e-06"',
-            Access: DataAccess.ReadWrite
+            Access: DataAccess.ReadWrite,
+            FGet: "get_FORMULA",
+            FSet: "set_FORMULA",
         },
     }
 
@@ -116,45 +246,88 @@ class Albaem2OneDCtrl(OneDController):
     def __init__(self, inst, props, *args, **kwargs):
         """Class initialization."""
         OneDController.__init__(self, inst, props, *args, **kwargs)
-        self.ip_config = (self.AlbaEmHost, self.Port)
-        self.albaem_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.albaem_socket.settimeout(1)
-        self.albaem_socket.connect(self.ip_config)
+        if self.UseAsyncio:
+            transport_class = AsyncAlbaEm2Transport
+        else:
+            transport_class = AlbaEm2Transport
+        self.albaem = transport_class(self.AlbaEmHost, self.Port,
+                                      log=self._log)
         self.itime = 0.0
         self.master = None
         self._latency_time = 0.001  # In fact, it is just 320us
         self._repetitions = 0
-        self.formulas = {1: 'value', 2: 'value', 3: 'value', 4:'value'}
+        self.formulas = {1: Formula('value'), 2: Formula('value'),
+                         3: Formula('value'), 4: Formula('value')}
 
+        self._dtype = np.float64
         self._points_per_step = 1
+        self._max_chunk_points = MAX_CHUNK_POINTS
+        self._is_aborted = False
 
-        self.lock = Lock()
-
-    @debug_it
+        # Incremental readout: points already read from the device and
+        # points per channel waiting to complete a spectrum
+        self._incremental = False
+        self._index = 0
+        self._pending = [self._empty()] * 5
+
+        # Background readout: points of the whole acquisition drained by
+        # the reader thread
+        self._background_read = False
+        self._reader = AcquisitionReader(self.albaem, log=self._log)
+        self._reading_in_background = False
+
+        # Answers the state polls while the acquisition cannot be over
+        self._predictor = StatePredictor()
+
+        # The methods are only wrapped while the tracing is enabled
+        self._tracer = Tracer(self, self._log)
+        # Background readout: all the points of the acquisition, filled up
+        # to the number of points drained per channel
+        self._acquired = [self._empty()] * 5
+        self._nb_acquired = [0] * 5
+
+    @traced
     def AddDevice(self, axis):
         """Add device to controller."""
         pass
 
-    @debug_it
+    @traced
     def DeleteDevice(self, axis):
         """Delete device from the controller."""
-        # self.albaem_socket.close()
+        # self.albaem.close()
         pass
 
-    @debug_it
+    @traced
     def PrepareOne(self, axis, value, repetitions, latency, nb_starts):
         self._is_aborted = False
 
 
-    @debug_it
+    @traced
     def PreStateAll(self):
         pass
 
-    @debug_it
+    @traced
     def StateAll(self):
         """Read state of all axis."""
-        state = self.sendCmd('ACQU:STAT?')
+        if not self._predictor.needs_query():
+            # The acquisition cannot be over yet, it is still moving
+            return
+        try:
+            state = self.albaem.send('ACQU:STAT?')
+        except DeviceUnavailableError as e:
+            # Known to be down, reported without waiting for any timeout
+            self.state = State.Fault
+            self.status = str(e)
+            return
+        self._set_state(state)
+        self._predictor.queried(self.state == State.Moving)
+
+        # Once the acquisition is over the reader takes the last points, so
+        # they are available for the next ReadAll
+        if self.state != State.Moving and self._reader.is_alive():
+            self._reader.finish()
 
+    def _set_state(self, state):
         if state in ['STATE_ACQUIRING', 'STATE_RUNNING']:
             self.state = State.Moving
 
@@ -168,12 +341,12 @@ class Albaem2OneDCtrl(OneDController):
             self.state = State.Fault
         self.status = state
 
-    @debug_it
+    @traced
     def StateOne(self, axis):
         """Read state of one axis."""
         return self.state, self.status
 
-    @debug_it
+    @traced
     @handle_error(msg="LoadOne: Could not configure the device!")
     def LoadOne(self, axis, value, repetitions, latency_time):
         if axis != 1:
@@ -186,7 +359,7 @@ class Albaem2OneDCtrl(OneDController):
         if val < 0.1:   # minimum integration time
             self._log.debug("The minimum integration time is 0.1 ms")
             raise Exception('The minimum integration time is 0.1 ms')
-        self.sendCmd('ACQU:TIME %r' % val)
+        cmds = ['ACQU:TIME %r' % val]
 
         if self._synchronization in [AcqSynch.SoftwareTrigger,
                                      AcqSynch.SoftwareGate]:
@@ -195,25 +368,34 @@ class Albaem2OneDCtrl(OneDController):
 
         elif self._synchronization == AcqSynch.HardwareTrigger:
             source = 'HARDWARE'
-            self._repetitions = repetitions
-            if repetitions == 1:
-                self._repetitions = self._points_per_step
+            self._repetitions = self._hw_repetitions(repetitions)
         elif self._synchronization == AcqSynch.HardwareGate:
             source = 'GATE'
-            self._repetitions = repetitions
-            if repetitions == 1:
-                self._repetitions = self._points_per_step
-        self.sendCmd('TRIG:MODE %s' % source)
+            self._repetitions = self._hw_repetitions(repetitions)
+        cmds.append('TRIG:MODE %s' % source)
         if self._synchronization in [AcqSynch.HardwareTrigger,
                                      AcqSynch.HardwareGate]:
-            self.sendCmd('TRIG:INPU %s' % self.ExtTriggerInput)
+            cmds.append('TRIG:INPU %s' % self.ExtTriggerInput)
         # Set Number of Triggers
-        self.sendCmd('ACQU:NTRI %r' % self._repetitions)
+        cmds.append('ACQU:NTRI %r' % self._repetitions)
+        # THIS CONTROLLER IS NOT YET READY FOR TIMESTAMP DATA
+        cmds.append('TMST 0')
+        # The whole configuration is sent in a single round-trip and only
+        # the settings which changed since the last LoadOne are written
+        self.albaem.configure(cmds)
 
         # Array of arrays for ID readings from all channels
-        self.new_data = [[] for index in range(0, 5)]
+        self.new_data = [self._empty()] * 5
+
+    def _hw_repetitions(self, repetitions):
+        if self._incremental:
+            # PointsPerStep triggers for each repetition
+            return repetitions * self._points_per_step
+        if repetitions == 1:
+            return self._points_per_step
+        return repetitions
 
-    @debug_it
+    @traced
     @handle_error(msg="PreStartOne: Could not configure the device!")
     def PreStartOne(self, axis, value):
         #Check if the communication is stable before start
@@ -223,7 +405,7 @@ class Albaem2OneDCtrl(OneDController):
 
         return True
 
-    @debug_it
+    @traced
     @handle_error(msg="StartAll: Could not configure the device!")
     def StartAll(self):
         """
@@ -238,180 +420,192 @@ class Albaem2OneDCtrl(OneDController):
             # TRIG:SWSEt
             cmd += ' SWTRIG'
 
-        self.sendCmd(cmd)
-        # THIS PROTECTION HAS TO BE REVIEWED
-        # FAST INTEGRATION TIMES MAY RAISE WRONG EXCEPTIONS
-        # e.g. 10ms ACQTIME -> self.state MAY BE NOT MOVING BECAUSE
-        # FINISHED, NOT FAILED
-        self.StateAll()
-        t0 = time.time()
-        while (self.state != State.Moving):
-            if time.time() - t0 > 3:
-                raise Exception('The HW did not start the acquisition')
-            self.StateAll()
+        # The device buffer starts from zero on every start
+        self._reader.stop()
+        self._reading_in_background = False
+        self._index = 0
+        self._pending = [self._empty()] * 5
+        self._predictor.disarm()
+        start = time.monotonic()
+        # A short acquisition may be over before the state is read, it is
+        # started if all the triggers were already acquired
+        if not (self._check_started([cmd]) or
+                wait_for(self._check_started, START_TIMEOUT)):
+            raise Exception('The HW did not start the acquisition')
+        if self.state == State.Moving:
+            # Every trigger lasts at least the integration time, the gates
+            # last what the hardware decides
+            itime = 0 if self._synchronization == AcqSynch.HardwareGate \
+                else self.itime
+            self._predictor.arm(start, itime, self._repetitions)
+
+        if self._background_read and self._synchronization in [
+                AcqSynch.HardwareTrigger, AcqSynch.HardwareGate]:
+            self._reader.chunk_size = self._max_chunk_points
+            self._reader.dtype = self._dtype
+            # Allocated once, the reads only fill them
+            self._acquired = [np.empty(self._repetitions, self._dtype)
+                              for _ in range(5)]
+            self._nb_acquired = [0] * 5
+            self._reader.start(self._repetitions)
+            self._reading_in_background = True
         return True
 
-    @debug_it
+    def _check_started(self, cmds=()):
+        # The state and the number of points in the same round-trip as the
+        # commands, e.g. the start
+        answers = self.albaem.send_many(list(cmds) + ['ACQU:STAT?', 'ACQU:NDAT?'])
+        state, ndat = answers[-2:] if answers else (None, None)
+        self._set_state(state)
+        self._predictor.queried(self.state == State.Moving)
+        if self.state == State.Moving:
+            return True
+        try:
+            return 0 < self._repetitions <= int(ndat)
+        except (TypeError, ValueError):
+            return False
+
+    @traced
     def StartOne(self, axis, value):
         pass
 
-    @debug_it
+    @traced
     @handle_error(msg="ReadAll: Unable to read from the device!")
     def ReadAll(self):
-        self.new_data = [[] for index in range(0, 5)]
+        # The time channel is only built if it is read, unless the device
+        # sent the duration of every point
+        self.new_data = [None] + [self._empty()] * 4
         # Skip reading for aborted scans
         if self._is_aborted:
             return
+        if self._incremental and self._synchronization in [
+                AcqSynch.HardwareTrigger, AcqSynch.HardwareGate]:
+            self._read_new_spectra()
+            return
+        if self._reading_in_background:
+            self._read_acquired()
+            return
         data_ready = int(self.sendCmd('ACQU:NDAT?'))
+        self._predictor.progress(data_ready)
 
-        # THIS CONTROLLER IS NOT YET READY FOR TIMESTAMP DATA
-        self.sendCmd('TMST 0')
-
-        msg = 'ACQU:MEAS? %r,%r' % (-1, data_ready)
-        raw_data = self.sendCmd(msg)
-
-        data = eval(raw_data)
-        axis = 1
+        data = self.albaem.read_measurements(0, data_ready,
+                                             self._max_chunk_points,
+                                             self._dtype)
         for chn_name, values in data:
+            axis = channel_index(chn_name)
+            self.new_data[axis] = self._apply_formula(axis, values)
+
+    def _read_new_spectra(self):
+        # Fetch only the points acquired since the last read and split them
+        # in spectra of PointsPerStep points. An incomplete spectrum is kept
+        # until the rest of its points arrive.
+        data = self._read_new_points()
+        if not data:
+            return
 
-            # Apply the formula for each value
-            formula = self.formulas[axis]
-            formula = formula.lower()
-            values_formula = [eval(formula, {'value': val}) for val
-                                in values]
-            self.new_data[axis].extend(values_formula)
-            axis +=1
-        time_data = [self.itime] * len(self.new_data[1])
-        self.new_data[0] = (time_data)
-
-
-    @debug_it
+        points = self._points_per_step
+        for chn_name, values in data:
+            axis = channel_index(chn_name)
+            values = self._apply_formula(axis, values)
+            if len(self._pending[axis]):
+                values = np.concatenate((self._pending[axis], values))
+            end = len(values) - len(values) % points
+            # One spectrum per row, a view of the points read
+            self.new_data[axis] = values[:end].reshape(-1, points)
+            self._pending[axis] = values[end:]
+
+    def _read_acquired(self):
+        # All the points of the acquisition, the new ones already drained
+        # by the reader thread are copied after the previous ones
+        for chn_name, values in self._reader.pop():
+            axis = channel_index(chn_name)
+            values = self._apply_formula(axis, values)
+            start = self._nb_acquired[axis]
+            end = min(start + len(values), len(self._acquired[axis]))
+            self._acquired[axis][start:end] = values[:end - start]
+            self._nb_acquired[axis] = end
+        for axis, nb_points in enumerate(self._nb_acquired):
+            # The time channel only if the device sent the durations
+            if axis > 0 or nb_points > 0:
+                self.new_data[axis] = self._acquired[axis][:nb_points]
+
+    def _read_new_points(self):
+        if self._reading_in_background:
+            return self._reader.pop()
+        data_ready = int(self.sendCmd('ACQU:NDAT?'))
+        self._predictor.progress(data_ready)
+        if data_ready <= self._index:
+            return []
+        data = self.albaem.read_measurements(
+            self._index, data_ready - self._index, self._max_chunk_points,
+            self._dtype)
+        self._index = data_ready
+        return data
+
+    def _empty(self):
+        return np.empty(0, self._dtype)
+
+    def _apply_formula(self, axis, values):
+        # Apply the formula to all the values at once, the durations of the
+        # points have none
+        if axis == 0:
+            return values
+        return self.formulas[axis](values)
+
+    def _time_data(self):
+        if self.new_data[0] is not None:
+            return self.new_data[0]
+        # The integration time of every point, without allocating them
+        return np.broadcast_to(self._dtype(self.itime), self.new_data[1].shape)
+
+    @traced
     def ReadOne(self, axis):
         if len(self.new_data) == 0:
             return None
 
+        # The arrays are returned as views, never copied
+        if axis == 1:
+            values = self._time_data()
+        else:
+            values = self.new_data[axis - 1]
         if self._synchronization in [AcqSynch.SoftwareTrigger,
                                      AcqSynch.SoftwareGate]:
-            return [self.new_data[axis - 1][0]]
+            return values[:1]
+        elif self._incremental:
+            # Only the spectra completed since the last ReadAll
+            return values
         else:
-            val = self.new_data[axis - 1]
-            return [val]
+            # A single spectrum with all the points
+            return values[np.newaxis]
 
-    @debug_it
+    @traced
     @handle_error(msg="AbortOne: Could not abort device!")
     def AbortOne(self, axis):
+        self._reader.stop()
+        self._predictor.disarm()
         self.sendCmd('ACQU:STOP')
         self._is_aborted = True
 
-    @debug_it
+    @traced
     @handle_error(msg="sendCmd: Could not configure device!")
-    def sendCmd(self, cmd, rw=True, size=8096):
-        with self.lock:
-            cmd += ';\n'
-
-            # Protection in case of reconnect the device in the network.
-            # It send the command and in case of broken socket it creates a
-            # new one.
-            retries = 2
-            for i in range(retries):
-                try:
-                    self.albaem_socket.sendall(cmd.encode())
-                    break
-                except socket.timeout:
-                    self._log.debug(
-                        'Socket timeout! reconnecting and commanding '
-                        'again %s' % cmd)
-                    self.albaem_socket = socket.socket(
-                        socket.AF_INET, socket.SOCK_STREAM)
-                    self.albaem_socket.settimeout(1)
-                    self.albaem_socket.connect(self.ip_config)
-            if rw:
-                # WARNING...
-                # socket.recv(size) IS NEVER ENOUGH TO RECEIVE DATA !!!
-                # you should know by the protocol either:
-                # the length of data to be received
-                # or
-                # wait until a special end-of-transfer control
-                # In this case: while not '\r' in data:
-                #                 receive more data...
-                ################################################
-                # AS IT IS SAID IN https://docs.python.org/3/howto/sockets.html
-                # SECTION "3 Using a Socket"
-                #
-                # A protocol like HTTP uses a socket for only one
-                # transfer. The client sends a request, the reads a
-                # reply. That's it. The socket is discarded. This
-                # means that a client can detect the end of the reply
-                # by receiving 0 bytes.
-                #
-                # But if you plan to reuse your socket for further
-                # transfers, you need to realize that there is no
-                # "EOT" (End of Transfer) on a socket. I repeat: if a
-                # socket send or recv returns after handling 0 bytes,
-                # the connection has been broken. If the connection
-                # has not been broken, you may wait on a recv forever,
-                # because the socket will not tell you that there's
-                # nothing more to read (for now). Now if you think
-                # about that a bit, you'll come to realize a
-                # fundamental truth of sockets: messages must either
-                # be fixed length (yuck), or be delimited (shrug), or
-                # indicate how long they are (much better), or end by
-                # shutting down the connection. The choice is entirely
-                # yours, (but some ways are righter than others).
-                ################################################
-                data = ""
-                acquired = False
-                while True:
-                    # SOME TIMEOUTS OCCUR WHEN USING THE WEBPAGE
-                    retries = 5
-                    for i in range(retries):
-                        try:
-                            data += self.albaem_socket.recv(size).decode()
-                            acquired = True
-                            break
-                        except socket.timeout:
-                            self._log.debug(
-                                'Socket timeout! Reading... from  %s '
-                                'command' %cmd[:-2])
-                            self.albaem_socket = socket.socket(
-                                socket.AF_INET, socket.SOCK_STREAM)
-                            self.albaem_socket.settimeout(1)
-                            self.albaem_socket.connect(self.ip_config)
-                            self.albaem_socket.sendall(cmd.encode())
-                            pass
-
-                    if acquired == False:
-                        msg = "Unable to communicate with AlbaEm2, try to " \
-                              "restart the Device"
-                        raise RuntimeError(msg)
-                    try:
-                        if data[-1] == '\n':
-                            break
-                    except Exception as e:
-                        self._log.error(e)
-                        return None
-
-                # NOTE: EM MAY ANSWER WITH MULTIPLE ANSWERS IN CASE OF AN
-                # EXCEPTION
-                # SIMPLY GET THE LAST ONE
-                if data.count(';') > 1:
-                    data = data.rsplit(';')[-2:]
-                return data[:-2]
+    def sendCmd(self, cmd, rw=True):
+        return self.albaem.send(cmd, rw)
+
 
 ###############################################################################
 #                Axis Extra Attribute Methods
 ###############################################################################
 
-    @debug_it
+    @traced
     @handle_error(msg="get_Range:")
     def get_Range(self, axis):
         if axis == 1:
             raise RuntimeError('The axis 1 does not use the extra attributes')
         axis -= 1
         cmd = 'CHAN{0:02d}:CABO:RANGE?'.format(axis)
-        return self.sendCmd(cmd)
+        return self.albaem.setting(cmd)
 
-    @debug_it
+    @traced
     @handle_error(msg="set_Range:")
     def set_Range(self, axis, value):
         if axis == 1:
@@ -420,21 +614,16 @@ class Albaem2OneDCtrl(OneDController):
         cmd = 'CHAN{0:02d}:CABO:RANGE {1}'.format(axis, value)
         self.sendCmd(cmd)
 
-    @debug_it
+    @traced
     @handle_error(msg="get_Inversion:")
     def get_Inversion(self, axis):
         if axis == 1:
             raise RuntimeError('The axis 1 does not use the extra attributes')
         axis -= 1
         cmd = 'CHAN{0:02d}:CABO:INVE?'.format(axis)
-        val = self.sendCmd(cmd)
-        if val.lower() == 'off':
-            ret = False
-        elif val.lower() == 'on':
-            ret = True
-        return ret
-
-    @debug_it
+        return parse_switch(self.albaem.setting(cmd))
+
+    @traced
     @handle_error(msg="set_Inversion:")
     def set_Inversion(self, axis, value):
         if axis == 1:
@@ -443,37 +632,173 @@ class Albaem2OneDCtrl(OneDController):
         cmd = 'CHAN{0:02d}:CABO:INVE {1}'.format(axis, int(value))
         self.sendCmd(cmd)
 
-    @debug_it
+    @traced
     @handle_error(msg="get_InstantCurrent:")
     def get_InstantCurrent(self, axis):
         if axis == 1:
             raise RuntimeError('The axis 1 does not use the extra attributes')
-        axis -= 1
-        cmd = 'CHAN{0:02d}:INSCurrent?'.format(axis)
-        return eval(self.sendCmd(cmd))
+        return self.albaem.instant_currents.get()[axis - 2]
+
+    @traced
+    @handle_error(msg="get_FORMULA:")
+    def get_FORMULA(self, axis):
+        if axis == 1:
+            raise RuntimeError('The axis 1 does not use the extra attributes')
+        return self.formulas[axis - 1].expression
+
+    @traced
+    @handle_error(msg="set_FORMULA:")
+    def set_FORMULA(self, axis, value):
+        if axis == 1:
+            raise RuntimeError('The axis 1 does not use the extra attributes')
+        # Validated and compiled once, applied on every ReadAll
+        self.formulas[axis - 1] = Formula(value)
 
 
 ###############################################################################
 #                Controller Extra Attribute Methods
 ###############################################################################
 
-    @debug_it
+    @traced
     @handle_error(msg="get_AcquisitionMode:")
     def get_AcquisitionMode(self):
-        value = self.sendCmd('ACQU:MODE?')
-        return value
+        return self.albaem.setting('ACQU:MODE?')
 
-    @debug_it
+    @traced
     @handle_error(msg="set_AcquisitionMode:")
     def set_AcquisitionMode(self, value):
         self.sendCmd('ACQU:MODE %s' % value)
 
-    @debug_it
+    @traced
     @handle_error(msg="get_PointsPerStep:")
     def get_PointsPerStep(self):
         return self._points_per_step
 
-    @debug_it
+    @traced
     @handle_error(msg="set_PointsPerStep:")
     def set_PointsPerStep(self, value):
         self._points_per_step = value
+
+    @traced
+    @handle_error(msg="get_IncrementalRead:")
+    def get_IncrementalRead(self):
+        return self._incremental
+
+    @traced
+    @handle_error(msg="set_IncrementalRead:")
+    def set_IncrementalRead(self, value):
+        self._incremental = value
+
+    @traced
+    @handle_error(msg="get_MaxChunkPoints:")
+    def get_MaxChunkPoints(self):
+        return self._max_chunk_points
+
+    @traced
+    @handle_error(msg="set_MaxChunkPoints:")
+    def set_MaxChunkPoints(self, value):
+        self._max_chunk_points = value
+
+    @traced
+    @handle_error(msg="get_BackgroundRead:")
+    def get_BackgroundRead(self):
+        return self._background_read
+
+    @traced
+    @handle_error(msg="set_BackgroundRead:")
+    def set_BackgroundRead(self, value):
+        self._background_read = value
+
+    @traced
+    @handle_error(msg="get_BinaryTransfer:")
+    def get_BinaryTransfer(self):
+        return self.albaem.binary
+
+    @traced
+    @handle_error(msg="set_BinaryTransfer:")
+    def set_BinaryTransfer(self, value):
+        self.albaem.binary = value
+
+    @traced
+    @handle_error(msg="get_Statistics:")
+    def get_Statistics(self):
+        summary = self.albaem.stats.summary()
+        summary['state_polls'] = self._predictor.summary()
+        return json.dumps(summary)
+
+    @traced
+    @handle_error(msg="get_Timeouts:")
+    def get_Timeouts(self):
+        return self.albaem.stats.timeouts
+
+    @traced
+    @handle_error(msg="get_Reconnections:")
+    def get_Reconnections(self):
+        return self.albaem.stats.reconnections
+
+    @traced
+    @handle_error(msg="get_InstantCurrents:")
+    def get_InstantCurrents(self):
+        return self.albaem.instant_currents.get()
+
+    @traced
+    @handle_error(msg="get_InstantCurrentPeriod:")
+    def get_InstantCurrentPeriod(self):
+        return self.albaem.instant_currents.period
+
+    @traced
+    @handle_error(msg="set_InstantCurrentPeriod:")
+    def set_InstantCurrentPeriod(self, value):
+        self.albaem.instant_currents.period = value
+
+    @traced
+    @handle_error(msg="get_SettingsRefreshPeriod:")
+    def get_SettingsRefreshPeriod(self):
+        return self.albaem.settings.period
+
+    @traced
+    @handle_error(msg="set_SettingsRefreshPeriod:")
+    def set_SettingsRefreshPeriod(self, value):
+        self.albaem.settings.period = value
+
+    @traced
+    @handle_error(msg="get_StatePollingInterval:")
+    def get_StatePollingInterval(self):
+        return self._predictor.max_interval
+
+    @traced
+    @handle_error(msg="set_StatePollingInterval:")
+    def set_StatePollingInterval(self, value):
+        self._predictor.max_interval = value
+
+    @handle_error(msg="get_Tracing:")
+    def get_Tracing(self):
+        return self._tracer.enabled
+
+    @handle_error(msg="set_Tracing:")
+    def set_Tracing(self, value):
+        if value:
+            self._tracer.enable(self._tracer.sampling)
+        else:
+            self._tracer.disable()
+
+    @handle_error(msg="get_TracingSampling:")
+    def get_TracingSampling(self):
+        return self._tracer.sampling
+
+    @handle_error(msg="set_TracingSampling:")
+    def set_TracingSampling(self, value):
+        self._tracer.sampling = max(1, value)
+
+    @traced
+    @handle_error(msg="get_DataType:")
+    def get_DataType(self):
+        return np.dtype(self._dtype).name
+
+    @traced
+    @handle_error(msg="set_DataType:")
+    def set_DataType(self, value):
+        if value not in DATA_TYPES:
+            raise ValueError('DataType must be one of %s' %
+                             ', '.join(sorted(DATA_TYPES)))
+        self._dtype = DATA_TYPES[value]
@@ -4,6 +4,21 @@
 
 import pytest
 
+from sardana_albaem.simulator import AlbaEm2Simulator
+
 __author__ = 'kits'
 __docformat__ = 'restructuredtext'
 
+
+@pytest.fixture
+def simulator():
+    """AlbaEm2 simulator running in a background thread."""
+    with AlbaEm2Simulator(trigger_rate=1000) as sim:
+        yield sim
+
+
+@pytest.fixture
+def ctrl_props(simulator):
+    """Controller properties to connect to the simulator."""
+    return {'AlbaEmHost': simulator.host, 'Port': simulator.port,
+            'ExtTriggerInput': 'DIO_1', 'UseAsyncio': False}
@@ -2,10 +2,307 @@
 
 """Test suite for albaem."""
 
+import json
+import time
+
+import numpy as np
+import pytest
+
+from sardana import State
+from sardana.pool import AcqSynch
+
+from sardana_albaem.ctrl.Albaem2CoTiCtrl import Albaem2CoTiCtrl
+from sardana_albaem.ctrl.Albaem2OneDCtrl import Albaem2OneDCtrl
+
 __author__='kits'
 __docformat__='restructuredtext'
 
-def test_albaem():
-    """Some template test for the albaem package."""
-    pass
 
+def wait_on(ctrl, timeout=5):
+    t0 = time.time()
+    ctrl.StateAll()
+    while ctrl.StateOne(1)[0] == State.Moving:
+        assert time.time() - t0 < timeout
+        time.sleep(0.005)
+        ctrl.StateAll()
+
+
+def test_albaem_software_count(ctrl_props):
+    """A software triggered count of the CoTi controller."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl.SetAxisExtraPar(2, 'formula', 'value * 10')
+    ctrl.LoadOne(1, 0.01, 1, 0)
+    ctrl.PreStartOne(1)
+    ctrl.StartAll()
+    wait_on(ctrl)
+    ctrl.ReadAll()
+    assert ctrl.ReadOne(1).value == 0.01
+    assert ctrl.ReadOne(2).value == 1.0
+    assert ctrl.ReadOne(5).value == 0.4
+
+
+def test_albaem_software_count_round_trips(ctrl_props):
+    """A software count asks the number of points only with the state."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl.LoadOne(1, 0.01, 1, 0)
+    # The second count, the format of the measurements is known by then
+    for _ in range(2):
+        ctrl.albaem.stats.reset()
+        for axis in range(1, 6):
+            assert ctrl.PreStartOne(axis)
+        ctrl.StartAll()
+        wait_on(ctrl)
+        ctrl.ReadAll()
+        assert ctrl.ReadOne(2).value == 0.1
+    commands = ctrl.albaem.stats.commands
+    assert sorted(commands) == ['ACQU:MEAS?',
+                                'ACQU:START;ACQU:STAT?;ACQU:NDAT?',
+                                'ACQU:STAT?;ACQU:NDAT?']
+    assert commands['ACQU:MEAS?'].count == 1
+
+
+def test_albaem_count_over_before_state(ctrl_props, monkeypatch):
+    """A count already over when the state is read is started."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl.LoadOne(1, 0.01, 1, 0)
+    send_many = ctrl.albaem.send_many
+
+    def late_state(cmds, rw=True):
+        if not cmds[0].startswith('ACQU:START'):
+            return send_many(cmds, rw)
+        answers = send_many(cmds[:1], rw)
+        time.sleep(0.05)
+        return answers + send_many(cmds[1:], rw)
+
+    monkeypatch.setattr(ctrl.albaem, 'send_many', late_state)
+    ctrl.PreStartOne(1)
+    assert ctrl.StartAll()
+    assert ctrl.StateOne(1)[0] == State.On
+    ctrl.ReadAll()
+    assert ctrl.ReadOne(2).value == 0.1
+
+
+def test_albaem_extra_answers(ctrl_props, monkeypatch):
+    """The state is read even if the device adds answers of an error."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    send_many = ctrl.albaem.send_many
+
+    def extra_answer(cmds, rw=True):
+        return ['ERROR'] + send_many(cmds, rw)
+
+    monkeypatch.setattr(ctrl.albaem, 'send_many', extra_answer)
+    ctrl.StateAll()
+    assert ctrl.StateOne(1) == (State.On, 'STATE_ON')
+    ctrl.LoadOne(1, 0.01, 1, 0)
+    assert ctrl.StartAll()
+    wait_on(ctrl)
+
+
+def test_albaem_state_error(ctrl_props, monkeypatch):
+    """An error answered to the state is reported as a fault."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    send_many = ctrl.albaem.send_many
+
+    def error_state(cmds, rw=True):
+        answers = send_many(cmds, rw)
+        answers[-2] = 'ERROR: Unknown command'
+        return answers
+
+    monkeypatch.setattr(ctrl.albaem, 'send_many', error_state)
+    ctrl.StateAll()
+    assert ctrl.StateOne(1) == (State.Fault, 'ERROR: Unknown command')
+    # The start is checked with the same state reading
+    ctrl.LoadOne(1, 0.01, 1, 0)
+    ctrl.StartAll()
+    assert ctrl.StateOne(1)[0] == State.Fault
+
+
+def test_albaem_hardware_trigger(ctrl_props, simulator):
+    """All the points of a hardware triggered acquisition are read once."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.LoadOne(1, 0.001, 50, 0)
+    assert simulator.model.trig_mode == 'HARDWARE'
+    assert simulator.model.ntri == 50
+    ctrl.StartAll()
+    values = []
+    while True:
+        ctrl.StateAll()
+        moving = ctrl.StateOne(1)[0] == State.Moving
+        ctrl.ReadAll()
+        values.extend(ctrl.ReadOne(3))
+        if not moving:
+            break
+    np.testing.assert_array_equal(values, np.arange(50) + 0.2)
+
+
+def test_albaem_predicted_state(ctrl_props, simulator):
+    """The state polls ask the device only when the end is near."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.LoadOne(1, 0.001, 300, 0)
+    ctrl.StartAll()
+    values = []
+    while True:
+        time.sleep(0.005)
+        ctrl.StateAll()
+        moving = ctrl.StateOne(1)[0] == State.Moving
+        ctrl.ReadAll()
+        values.extend(ctrl.ReadOne(3))
+        if not moving:
+            break
+    assert len(values) == 300
+    polls = json.loads(ctrl.GetCtrlPar('Statistics'))['state_polls']
+    assert polls['predicted'] > polls['queries']
+
+
+def test_albaem_oned_points_per_step(ctrl_props):
+    """The OneD controller returns the points of a step as a spectrum."""
+    ctrl = Albaem2OneDCtrl('test', ctrl_props)
+    ctrl.set_PointsPerStep(5)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.PrepareOne(1, 0.001, 1, 0, 1)
+    ctrl.LoadOne(1, 0.001, 1, 0)
+    ctrl.StartAll()
+    wait_on(ctrl)
+    ctrl.ReadAll()
+    np.testing.assert_array_equal(ctrl.ReadOne(2)[0], np.arange(5) + 0.1)
+    assert ctrl.get_InstantCurrent(3) == 2e-09
+
+
+def test_albaem_instant_currents(ctrl_props):
+    """The instant currents of the axes are read in a single exchange."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    currents = [ctrl.GetAxisExtraPar(axis, 'InstantCurrent')
+                for axis in range(2, 6)]
+    np.testing.assert_allclose(currents, [1e-09, 2e-09, 3e-09, 4e-09])
+    assert ctrl.GetCtrlPar('InstantCurrents') == currents
+    reads = [key for key in ctrl.albaem.stats.commands if 'INSC' in key]
+    assert len(reads) == 1
+    assert ctrl.albaem.stats.commands[reads[0]].count == 1
+    ctrl.SetCtrlPar('InstantCurrentPeriod', 0)
+    ctrl.GetAxisExtraPar(2, 'InstantCurrent')
+    assert ctrl.albaem.stats.commands[reads[0]].count == 2
+
+
+def test_albaem_settings_cache(ctrl_props, simulator):
+    """The settings are read in bulk and updated when written."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    stats = ctrl.albaem.stats
+    assert ctrl.GetAxisExtraPar(3, 'Range') == simulator.model.ranges[1]
+    assert ctrl.GetAxisExtraPar(3, 'Inversion') is False
+    ctrl.GetCtrlPar('AcquisitionMode')
+    assert len(stats.commands) == 1
+    ctrl.SetAxisExtraPar(3, 'Range', '1nA')
+    ctrl.SetAxisExtraPar(3, 'Inversion', True)
+    assert ctrl.GetAxisExtraPar(3, 'Range') == '1nA'
+    assert ctrl.GetAxisExtraPar(3, 'Inversion') is True
+    assert sum(cmd.count for cmd in stats.commands.values()) == 3
+    # Forgotten on a reconnection, the device may have been restarted
+    simulator.model.ranges[1] = '1uA'
+    ctrl.albaem.connect()
+    assert ctrl.GetAxisExtraPar(3, 'Range') == '1uA'
+
+
+def test_albaem_set_ranges(ctrl_props, simulator):
+    """The ranges of many axes are written and read back at once."""
+    ctrl = Albaem2OneDCtrl('test', ctrl_props)
+    ctrl.SendToCtrl('RefreshSettings')
+    ctrl.SendToCtrl('ResetStatistics')
+    changes = json.loads(ctrl.SendToCtrl(
+        'SetRanges {"2": "1nA", "3": "10nA", "5": "100pA"}'))
+    assert changes == {'2': ['1mA', '1nA'], '3': ['1mA', '10nA'],
+                       '5': ['1mA', '100pA']}
+    assert simulator.model.ranges == ['1nA', '10nA', '1mA', '100pA']
+    changes = json.loads(ctrl.SendToCtrl('SetInversions {"4": true}'))
+    assert changes == {'4': [False, True]}
+    assert sum(cmd.count for cmd in
+               ctrl.albaem.stats.commands.values()) == 2
+
+
+def test_albaem_settings_extra_answers(ctrl_props, simulator,
+                                      monkeypatch):
+    """Answers added by an error are not matched to the wrong settings."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    transfer = ctrl.albaem._transfer
+
+    def extra_answer(cmds, *args):
+        answers = transfer(cmds, *args)
+        if answers and len(cmds) > 1:
+            answers = ['ERROR'] + answers
+        return answers
+
+    monkeypatch.setattr(ctrl.albaem, '_transfer', extra_answer)
+    simulator.model.ranges = ['1mA', '10nA', '1nA', '100pA']
+    ranges = [ctrl.GetAxisExtraPar(axis, 'Range') for axis in range(2, 6)]
+    assert ranges == ['1mA', '10nA', '1nA', '100pA']
+    assert ctrl.GetAxisExtraPar(2, 'Inversion') is False
+    np.testing.assert_allclose(ctrl.GetCtrlPar('InstantCurrents'),
+                               [1e-09, 2e-09, 3e-09, 4e-09])
+    with pytest.raises(ValueError):
+        ctrl.SendToCtrl('SetRanges {"2": "1nA", "3": "1uA"}')
+    assert ctrl.albaem.cached('CHAN01:CABO:RANGE?') is None
+
+
+def test_albaem_oned_background_read(ctrl_props):
+    """The points drained in the background fill a preallocated array."""
+    ctrl = Albaem2OneDCtrl('test', ctrl_props)
+    ctrl.set_BackgroundRead(True)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.PrepareOne(1, 0.001, 200, 0, 1)
+    ctrl.LoadOne(1, 0.001, 200, 0)
+    ctrl.StartAll()
+    bases = []
+    while True:
+        time.sleep(0.02)
+        ctrl.StateAll()
+        moving = ctrl.StateOne(1)[0] == State.Moving
+        ctrl.ReadAll()
+        bases.append(ctrl.ReadOne(3).base.base)
+        if not moving:
+            break
+    assert all(base is bases[0] for base in bases)
+    np.testing.assert_array_equal(ctrl.ReadOne(3)[0], np.arange(200) + 0.2)
+
+
+def test_albaem_statistics(ctrl_props):
+    """The exchanges with the device are counted per command type."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl.SendToCtrl('ResetStatistics')
+    for _ in range(3):
+        ctrl.sendCmd('ACQU:STAT?')
+    stats = json.loads(ctrl.GetCtrlPar('Statistics'))
+    assert stats['commands']['ACQU:STAT?']['count'] == 3
+    assert stats['bytes_sent'] == 3 * len('ACQU:STAT?;\n')
+    assert stats['bytes_received'] == 3 * len('STATE_ON;\n')
+    assert ctrl.GetCtrlPar('Timeouts') == 0
+    ctrl.SendToCtrl('ResetStatistics')
+    assert json.loads(ctrl.GetCtrlPar('Statistics'))['commands'] == {}
+
+
+def test_albaem_coti_points_per_step(ctrl_props, simulator):
+    """Every step is reduced to the statistics of its points."""
+    ctrl = Albaem2CoTiCtrl('test', ctrl_props)
+    ctrl.SetCtrlPar('PointsPerStep', 4)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.LoadOne(1, 0.001, 5, 0)
+    assert simulator.model.ntri == 20
+    ctrl.StartAll()
+    means = []
+    times = []
+    while True:
+        ctrl.StateAll()
+        moving = ctrl.StateOne(1)[0] == State.Moving
+        ctrl.ReadAll()
+        means.extend(ctrl.ReadOne(2))
+        times.extend(ctrl.ReadOne(1))
+        if not moving:
+            break
+    # Points i + 0.1 of the steps [0..3], [4..7], ...
+    np.testing.assert_allclose(means, np.arange(5) * 4 + 1.6)
+    # The integration time of the 4 points of every step
+    np.testing.assert_allclose(times, [0.004] * 5)
+    assert ctrl.GetAxisExtraPar(2, 'StepMin') == 16.1
+    assert ctrl.GetAxisExtraPar(2, 'StepMax') == 19.1
+    assert ctrl.GetAxisExtraPar(2, 'StepStdDev') == \
+        np.std([16.1, 17.1, 18.1, 19.1])
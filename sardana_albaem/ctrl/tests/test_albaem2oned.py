@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""Tests for the Albaem2OneDCtrl readout."""
+
+import numpy as np
+import pytest
+
+from sardana.pool import AcqSynch
+
+from sardana_albaem.ctrl.Albaem2OneDCtrl import Albaem2OneDCtrl
+from sardana_albaem.transport import AlbaEm2Transport
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+class FakeBuffer(object):
+    """Answers ACQU:NDAT? and ACQU:MEAS? from a growing point counter."""
+
+    def __init__(self):
+        self.ndat = 0
+        self.requests = []
+        # Duration of every point, sent as the TIME entry
+        self.durations = None
+
+    def __call__(self, cmd, rw=True, expected=0):
+        if cmd == 'ACQU:NDAT?':
+            return str(self.ndat)
+        if cmd.startswith('ACQU:MEAS?'):
+            self.requests.append(cmd)
+            last, length = [int(v) for v in cmd.split()[1].split(',')]
+            points = ', '.join(str(float(i))
+                               for i in range(last + 1, last + 1 + length))
+            entries = ["['CHAN0%d', [%s]]" % (chn, points)
+                       for chn in range(1, 5)]
+            if self.durations is not None:
+                entries.append("['TIME', [%s]]" % ', '.join(
+                    [repr(self.durations)] * length))
+            return '[' + ', '.join(entries) + ']'
+        if cmd.startswith('FORM:DATA'):
+            # Firmware without binary blocks
+            return 'ERROR: unknown command FORM:DATA'
+        return 'ACK'
+
+
+@pytest.fixture
+def ctrl(monkeypatch):
+    monkeypatch.setattr(AlbaEm2Transport, 'connect', lambda self: None)
+    ctrl = Albaem2OneDCtrl('test', {'AlbaEmHost': 'albaem', 'Port': 5025,
+                                    'ExtTriggerInput': 'DIO_1',
+                                    'UseAsyncio': False})
+    ctrl.sendCmd = ctrl.albaem.send = FakeBuffer()
+    return ctrl
+
+
+def test_incremental_read(ctrl):
+    """Only new points are requested and returned as whole spectra."""
+    ctrl.set_IncrementalRead(True)
+    ctrl.set_PointsPerStep(2)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.itime = 0.1
+    ctrl._index = 0
+
+    ctrl.sendCmd.ndat = 3
+    ctrl.ReadAll()
+    spectra = ctrl.ReadOne(2)
+    assert len(spectra) == 1
+    np.testing.assert_array_equal(spectra[0], [0.0, 1.0])
+    np.testing.assert_array_equal(ctrl.ReadOne(1), [[0.1, 0.1]])
+
+    ctrl.sendCmd.ndat = 6
+    ctrl.ReadAll()
+    spectra = ctrl.ReadOne(5)
+    np.testing.assert_array_equal(spectra, [[2.0, 3.0], [4.0, 5.0]])
+    assert ctrl.sendCmd.requests == ['ACQU:MEAS? -1,3', 'ACQU:MEAS? 2,3']
+
+    ctrl.ReadAll()
+    assert len(ctrl.ReadOne(2)) == 0
+
+
+def test_chunked_read(ctrl):
+    """Pending points are drained in commands of bounded size."""
+    ctrl.set_MaxChunkPoints(4)
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.sendCmd.ndat = 10
+    ctrl.ReadAll()
+    assert ctrl.sendCmd.requests == ['ACQU:MEAS? -1,4', 'ACQU:MEAS? 3,4',
+                                     'ACQU:MEAS? 7,2']
+    np.testing.assert_array_equal(ctrl.ReadOne(3)[0], np.arange(10.0))
+
+
+def test_tracing(ctrl, caplog):
+    """The traced methods are only wrapped while the tracing is on."""
+    assert 'ReadOne' not in ctrl.__dict__
+    ctrl.new_data = [np.zeros((2, 1000))] * 5
+    ctrl._incremental = True
+    ctrl.set_TracingSampling(2)
+    ctrl.set_Tracing(True)
+    # Restored by caplog at the end of the test
+    caplog.set_level('DEBUG', logger=ctrl._log.log_obj.name)
+    for _ in range(4):
+        ctrl.ReadOne(2)
+    entries = [r.getMessage() for r in caplog.records
+               if r.getMessage().startswith('Entering ReadOne')]
+    assert len(entries) == 2
+    leaving = [r.getMessage() for r in caplog.records
+               if r.getMessage().startswith('Leaving without error ReadOne')]
+    assert 'array(shape=(1, 1000), dtype=float64)' in leaving[0]
+    ctrl.set_Tracing(False)
+    assert 'ReadOne' not in ctrl.__dict__
+
+
+def test_read_arrays(ctrl):
+    """The spectra are views of the arrays read, of the type chosen."""
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.set_DataType('float32')
+    ctrl.sendCmd.ndat = 5
+    ctrl.ReadAll()
+    spectra = ctrl.ReadOne(3)
+    assert spectra.dtype == np.float32
+    assert spectra.shape == (1, 5)
+    assert spectra.base is ctrl.new_data[2]
+    np.testing.assert_array_equal(spectra[0], np.arange(5))
+    assert ctrl.ReadOne(1).dtype == np.float32
+    # The formulas keep the type
+    ctrl.set_FORMULA(2, 'value * 2')
+    ctrl.ReadAll()
+    assert ctrl.ReadOne(2).dtype == np.float32
+    np.testing.assert_array_equal(ctrl.ReadOne(2)[0], np.arange(5) * 2)
+
+
+def test_time_channel(ctrl):
+    """The integration time is only broadcast, the durations are used."""
+    ctrl._synchronization = AcqSynch.HardwareTrigger
+    ctrl.itime = 0.1
+    ctrl.sendCmd.ndat = 1000
+    ctrl.ReadAll()
+    assert ctrl.new_data[0] is None
+    time_data = ctrl.ReadOne(1)
+    assert time_data.shape == (1, 1000)
+    assert time_data.strides[-1] == 0
+    assert np.all(time_data == 0.1)
+
+    ctrl.sendCmd.durations = 0.099
+    ctrl.ReadAll()
+    np.testing.assert_array_equal(ctrl.ReadOne(1), [[0.099] * 1000])
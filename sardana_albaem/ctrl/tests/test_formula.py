@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""Tests for the channel formulas."""
+
+import numpy as np
+import pytest
+
+from sardana_albaem.formula import Formula
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+def test_formula_vectorized():
+    values = np.array([10.0, 20.0, -30.0])
+    result = Formula('(VALUE/10)*1e-06')(values)
+    np.testing.assert_allclose(result, [1e-06, 2e-06, -3e-06])
+    np.testing.assert_allclose(Formula('abs(value)')(values), [10, 20, 30])
+
+
+def test_formula_identity_and_constant():
+    values = np.array([1.0, 2.0])
+    assert Formula('value')(values) is values
+    np.testing.assert_array_equal(Formula('0')(values), [0.0, 0.0])
+
+
+@pytest.mark.parametrize('expression', [
+    "__import__('os').getcwd()",
+    'value.__class__',
+    'open("/etc/passwd")',
+    "'a' * 3",
+    'value +',
+    'sqrt',
+    'value * sqrt',
+    'sqrt(sqrt)',
+])
+def test_formula_rejected(expression):
+    """Invalid or unsafe formulas are refused when they are set."""
+    with pytest.raises(ValueError):
+        Formula(expression)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""Tests for the AlbaEm2 reply parsers."""
+
+import numpy as np
+import pytest
+
+from sardana_albaem.parsing import parse_measurements, parse_float, \
+    parse_switch
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+def test_parse_measurements():
+    """Each channel is parsed into a float64 array, in reply order."""
+    raw = "[['CHAN01', [1.0, -2.5e-06]], ['CHAN02', [3, 4.25]]]"
+    data = parse_measurements(raw)
+    assert [name for name, _ in data] == ['CHAN01', 'CHAN02']
+    assert data[0][1].dtype == np.float64
+    np.testing.assert_array_equal(data[0][1], [1.0, -2.5e-06])
+    np.testing.assert_array_equal(data[1][1], [3.0, 4.25])
+
+
+def test_parse_measurements_empty_channels():
+    data = parse_measurements("[['CHAN01', []], ['CHAN02', []]]")
+    assert [len(values) for _, values in data] == [0, 0]
+
+
+@pytest.mark.parametrize('raw', [
+    "__import__('os').getcwd()",
+    "[['CHAN01', [1.0, os]]]",
+    "[garbage]",
+])
+def test_parse_measurements_rejects_invalid(raw):
+    """Anything but numbers is refused instead of being evaluated."""
+    with pytest.raises(ValueError):
+        parse_measurements(raw)
+
+
+def test_parse_float():
+    assert parse_float('1.5e-09') == 1.5e-09
+    with pytest.raises(ValueError):
+        parse_float("__import__('os')")
+
+
+def test_parse_switch():
+    assert parse_switch('ON') is True
+    assert parse_switch('0') is False
+    with pytest.raises(ValueError):
+        parse_switch('ERROR')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Tests for the prediction of the state polls."""
+
+import time
+
+import pytest
+
+from sardana_albaem.polling import StatePredictor, wait_for
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+def test_predictor_integration_time():
+    """The device is not asked before all the triggers were integrated."""
+    predictor = StatePredictor(max_interval=1.0, margin=0.02)
+    assert predictor.needs_query(0.0)
+    predictor.arm(10.0, 0.1, 5)
+    assert not predictor.needs_query(10.2)
+    assert not predictor.needs_query(10.47)
+    assert predictor.needs_query(10.49)
+    predictor.queried(False, now=10.5)
+    assert predictor.needs_query(10.6)
+    assert predictor.summary() == {'queries': 1, 'predicted': 2}
+
+
+def test_predictor_progress():
+    """The rest of the points take at least their integration time."""
+    predictor = StatePredictor(max_interval=10.0, margin=0.02)
+    predictor.arm(0.0, 0.001, 1000)
+    assert predictor.needs_query(1.0)
+    predictor.queried(True, ndat=100, now=1.0)
+    assert predictor.expected_end() == pytest.approx(1.9)
+    assert not predictor.needs_query(1.5)
+    assert predictor.needs_query(1.89)
+
+
+def test_predictor_late_triggers():
+    """Triggers starting late do not delay the end detection."""
+    predictor = StatePredictor(max_interval=10.0, margin=0.02)
+    predictor.arm(0.0, 0.001, 1000)
+    # The triggers start at 2 s, e.g. after the motor acceleration
+    predictor.queried(True, ndat=100, now=2.1)
+    assert predictor.expected_end() == pytest.approx(3.0)
+    assert predictor.needs_query(3.0)
+
+
+def test_predictor_max_interval():
+    """The device is asked at least every max_interval seconds."""
+    predictor = StatePredictor(max_interval=0.5)
+    predictor.arm(0.0, 1.0, 10)
+    assert not predictor.needs_query(0.4)
+    assert predictor.needs_query(0.5)
+    predictor.queried(True, now=0.5)
+    assert not predictor.needs_query(0.9)
+    predictor.max_interval = 0
+    assert predictor.needs_query(0.9)
+
+
+def test_wait_for():
+    """The condition is checked with growing delays until the timeout."""
+    calls = []
+
+    def condition():
+        calls.append(time.monotonic())
+        return len(calls) == 4
+
+    assert wait_for(condition, 1.0, delay_min=0.001, delay_max=0.004)
+    delays = [b - a for a, b in zip(calls, calls[1:])]
+    assert delays[-1] >= 0.004
+    t0 = time.monotonic()
+    assert not wait_for(lambda: False, 0.05)
+    assert 0.05 <= time.monotonic() - t0 < 0.5
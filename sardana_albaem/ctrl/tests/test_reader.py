@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""Tests for the background acquisition reader."""
+
+import time
+
+import numpy as np
+
+from sardana_albaem.reader import AcquisitionReader
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+class FakeTransport(object):
+    """Acquires two new points on every ACQU:NDAT? query."""
+
+    def __init__(self, total):
+        self.total = total
+        self.ndat = 0
+
+    def send(self, cmd):
+        assert cmd == 'ACQU:NDAT?'
+        self.ndat = min(self.ndat + 2, self.total)
+        return str(self.ndat)
+
+    def read_measurements(self, start, count, chunk_size=None,
+                          dtype=np.float64):
+        values = np.arange(start, start + count, dtype=np.float64)
+        return [('CHAN01', values), ('CHAN02', -values)]
+
+
+def test_reader_drains_all_points():
+    reader = AcquisitionReader(FakeTransport(7), period=0.001)
+    reader.start(7)
+    t0 = time.time()
+    while reader.is_alive() and time.time() - t0 < 5:
+        time.sleep(0.001)
+    assert not reader.is_alive()
+    data = reader.pop()
+    assert [name for name, _ in data] == ['CHAN01', 'CHAN02']
+    np.testing.assert_array_equal(data[0][1], np.arange(7.0))
+    np.testing.assert_array_equal(data[1][1], -np.arange(7.0))
+    assert reader.pop() == []
+
+
+def test_reader_stop():
+    reader = AcquisitionReader(FakeTransport(10 ** 9), period=0.001)
+    reader.start(10 ** 9)
+    reader.stop()
+    assert not reader.is_alive()
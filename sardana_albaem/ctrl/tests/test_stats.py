@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests for the communication statistics."""
+
+import pytest
+
+from sardana_albaem.stats import RttEstimator, TransportStats
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+def test_rtt_timeout():
+    """The timeout follows the round-trip time, longer for big replies."""
+    rtt = RttEstimator(initial=1.0, min_timeout=0.01)
+    assert rtt.timeout() == 1.0
+    for _ in range(50):
+        rtt.update(0.002, 10)
+    assert rtt.srtt == pytest.approx(0.002)
+    assert rtt.timeout() == pytest.approx(0.01)
+    # 1 MB at 10 MB/s
+    rtt.update(0.102, 1000000)
+    rtt.rate = 1e7
+    assert rtt.timeout(1000000) == pytest.approx(0.21, rel=0.01)
+
+
+def test_rtt_backoff():
+    """The timeouts double after a timeout, until the next reply."""
+    rtt = RttEstimator(initial=0.5, max_timeout=1.5)
+    rtt.backoff()
+    assert rtt.timeout() == 1.0
+    rtt.backoff()
+    assert rtt.timeout() == 1.5
+    rtt.update(0.5, 10)
+    assert rtt.timeout() == pytest.approx(1.5)
+
+
+def test_transport_stats():
+    """Only the exchanges with a reply update the round-trip time."""
+    stats = TransportStats()
+    stats.record(['ACQU:TIME 1.0'], 0.5, 15, 0)
+    assert stats.rtt(['ACQU:TIME 2.0']).srtt is None
+    stats.record(['ACQU:STAT?'], 0.001, 12, 10)
+    stats.record_timeout(['ACQU:STAT?'])
+    summary = stats.summary()
+    assert summary['timeouts'] == 1
+    assert summary['rtt']['ACQU:STAT?']['srtt'] == 0.001
+    stats.reset()
+    assert stats.rtt(['ACQU:STAT?']).srtt == 0.001
+
+
+def test_timeout_per_command():
+    """A slow command does not make the other ones wait longer."""
+    stats = TransportStats(timeout=1.0)
+    for _ in range(20):
+        stats.record(['ACQU:STAT?'], 0.001, 12, 10)
+        stats.record(['ACQU:START'], 0.3, 12, 4)
+    assert stats.timeout(['ACQU:STAT?']) == pytest.approx(0.1)
+    assert stats.timeout(['ACQU:START SWTRIG']) > 0.3
+    assert stats.timeout(['ACQU:NDAT?']) == 1.0
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+"""Tests for the AlbaEm2 socket transport."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from sardana_albaem.aio import AlbaEm2Group, AsyncAlbaEm2Transport
+from sardana_albaem.breaker import DeviceUnavailableError
+from sardana_albaem.simulator import AlbaEm2Simulator
+from sardana_albaem.transport import AlbaEm2Transport, LineReader
+
+__author__ = 'kits'
+__docformat__ = 'restructuredtext'
+
+
+def test_readline_fragmented():
+    """A reply split in many segments is returned once, complete."""
+    reader = LineReader(size=16)
+    a, b = socket.socketpair()
+    try:
+        payload = "[['CHAN01', [%s]]];" % ', '.join(['1.5'] * 1000)
+        raw = (payload + '\n').encode()
+
+        def write():
+            for i in range(0, len(raw), 7):
+                b.sendall(raw[i:i + 7])
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        assert reader.readline(a) == payload
+        writer.join()
+    finally:
+        a.close()
+        b.close()
+
+
+def test_readline_keeps_pending_replies():
+    """Bytes after the terminator are kept for the next reply."""
+    reader = LineReader(size=8)
+    a, b = socket.socketpair()
+    try:
+        b.sendall(b'STATE_ON;\nACK;\n')
+        assert reader.readline(a) == 'STATE_ON;'
+        assert reader.readline(a) == 'ACK;'
+        b.close()
+        assert reader.readline(a) is None
+    finally:
+        a.close()
+
+
+def test_readline_not_text():
+    """A reply that is not text is dropped with the pending bytes."""
+    reader = LineReader(size=8)
+    a, b = socket.socketpair()
+    try:
+        b.sendall(b'#18\xff\xfe\x00\x01\x02\x03\x04\x05;\n')
+        with pytest.raises(UnicodeDecodeError):
+            reader.readline(a)
+        b.sendall(b'STATE_ON;\n')
+        assert reader.readline(a) == 'STATE_ON;'
+    finally:
+        a.close()
+        b.close()
+
+
+def test_read_block():
+    """A binary block is read whole even if it contains the terminator."""
+    reader = LineReader(size=8)
+    a, b = socket.socketpair()
+    try:
+        b.sendall(b'#212a\nb\nc\nd\ne\nf\n;\nERROR: no;\n')
+        assert bytes(reader.read_block(a)) == b'a\nb\nc\nd\ne\nf\n'
+        # Any other reply is returned as text
+        assert reader.read_block(a) == 'ERROR: no;'
+    finally:
+        a.close()
+        b.close()
+
+
+@pytest.fixture
+def ack_server():
+    """Server answering 'ACK' to every command and recording the writes."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    server.settimeout(0.05)
+    received = []
+    done = threading.Event()
+
+    def serve():
+        while not done.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                while True:
+                    data = conn.recv(1024)
+                    if not data:
+                        break
+                    received.append(data)
+                    cmds = data.decode().rstrip(';\n').split(';')
+                    answer = ';'.join('ACK' for _ in cmds) + ';\n'
+                    conn.sendall(answer.encode())
+
+    worker = threading.Thread(target=serve)
+    worker.start()
+    transport = AlbaEm2Transport(*server.getsockname())
+    yield transport, received
+    transport.close()
+    done.set()
+    worker.join()
+    server.close()
+
+
+def test_send_many_single_write(ack_server):
+    """A command list is sent in one write and answered per command."""
+    transport, received = ack_server
+    answers = transport.send_many(['ACQU:TIME 100.0', 'TRIG:MODE SOFTWARE',
+                                   'ACQU:NTRI 1'])
+    assert received == [b'ACQU:TIME 100.0;TRIG:MODE SOFTWARE;ACQU:NTRI 1;\n']
+    assert answers == ['ACK', 'ACK', 'ACK']
+
+
+def test_configure_skips_unchanged_settings(ack_server):
+    """Only changed settings are written, until the socket is re-created."""
+    transport, received = ack_server
+    cmds = ['ACQU:TIME 100.0', 'TRIG:MODE SOFTWARE', 'ACQU:NTRI 1']
+    transport.configure(cmds)
+    assert transport.configure(cmds) == []
+    transport.configure(['ACQU:TIME 200.0', 'TRIG:MODE SOFTWARE'])
+    assert received == [b'ACQU:TIME 100.0;TRIG:MODE SOFTWARE;ACQU:NTRI 1;\n',
+                        b'ACQU:TIME 200.0;\n']
+    transport.invalidate()
+    assert transport.configure(['ACQU:NTRI 1']) == ['ACK']
+
+
+def test_async_group_and_transport(ack_server):
+    """The asyncio clients share the protocol of the socket transport."""
+    transport, received = ack_server
+    transport.close()
+    address = transport.ip_config
+
+    group = AlbaEm2Group([address])
+    assert group.send_many(['ACQU:NTRI 1', 'TRIG:MODE SOFTWARE']) == {
+        address: ['ACK', 'ACK']}
+    group.close()
+
+    transport = AsyncAlbaEm2Transport(*address)
+    assert transport.send('ACQU:TIME 1.0') == 'ACK'
+    assert transport.configure(['ACQU:TIME 1.0']) == []
+    transport.close()
+    assert received == [b'ACQU:NTRI 1;TRIG:MODE SOFTWARE;\n',
+                        b'ACQU:TIME 1.0;\n']
+
+
+def test_settings_and_write_channels():
+    """The settings are served from one bulk read and written at once."""
+    with AlbaEm2Simulator() as sim:
+        transport = AlbaEm2Transport(sim.host, sim.port)
+        try:
+            assert transport.setting('CHAN02:CABO:RANGE?') == '1mA'
+            assert transport.setting('ACQU:MODE?') == sim.model.acq_mode
+            assert len(transport.stats.commands) == 1
+            changes = transport.write_channels('RANGE', {2: '1nA', 4: '1uA'})
+            assert changes == {2: ['1mA', '1nA'], 4: ['1mA', '1uA']}
+            assert sim.model.ranges == ['1mA', '1nA', '1mA', '1uA']
+            with pytest.raises(ValueError):
+                transport.write_channels('RANGE', {1: 'wrong'})
+            assert transport.instant_currents.get() == pytest.approx(
+                [1e-09, 2e-09, 3e-09, 4e-09])
+        finally:
+            transport.close()
+
+
+def test_fragmented_replies():
+    """Replies written a few bytes at a time are read back whole."""
+    with AlbaEm2Simulator(fragment_size=3) as sim:
+        transport = AlbaEm2Transport(sim.host, sim.port)
+        transport.send_many(['ACQU:TIME 1.0', 'ACQU:NTRI 20'])
+        transport.send('ACQU:START SWTRIG')
+        time.sleep(0.05)
+        data = transport.read_measurements(0, 20)
+        transport.close()
+    assert len(data) == 4
+    assert data[0][1].tolist() == [i + 0.1 for i in range(20)]
+
+
+@pytest.mark.parametrize('binary_blocks', [True, False])
+@pytest.mark.parametrize('transport_class',
+                         [AlbaEm2Transport, AsyncAlbaEm2Transport])
+def test_measurement_formats(transport_class, binary_blocks):
+    """Binary blocks are used when supported, text otherwise."""
+    with AlbaEm2Simulator(binary_blocks=binary_blocks) as sim:
+        transport = transport_class(sim.host, sim.port)
+        transport.send_many(['ACQU:TIME 1.0', 'ACQU:NTRI 20'])
+        transport.send('ACQU:START SWTRIG')
+        time.sleep(0.05)
+        data = transport.read_measurements(0, 20, chunk_size=7)
+        transport.close()
+        assert sim.model.data_format == ('REAL,64' if binary_blocks
+                                         else 'ASCII')
+    assert [name for name, _ in data] == ['CHAN01', 'CHAN02', 'CHAN03',
+                                          'CHAN04']
+    assert data[3][1].tolist() == [i + 0.4 for i in range(20)]
+
+
+@pytest.mark.parametrize('transport_class',
+                         [AlbaEm2Transport, AsyncAlbaEm2Transport])
+def test_text_after_binary_session(transport_class):
+    """Text is selected again if an earlier session left binary blocks."""
+    with AlbaEm2Simulator() as sim:
+        sim.model.data_format = 'REAL,64'
+        transport = transport_class(sim.host, sim.port, binary=False)
+        transport.breaker.backoff_min = 0.01
+        try:
+            transport.send_many(['ACQU:TIME 1.0', 'ACQU:NTRI 5'])
+            transport.send('ACQU:START SWTRIG')
+            time.sleep(0.05)
+            data = transport.read_measurements(0, 5)
+            assert sim.model.data_format == 'ASCII'
+            assert data[0][1].tolist() == [i + 0.1 for i in range(5)]
+            # A binary block read as text breaks only that exchange
+            sim.model.data_format = 'REAL,64'
+            with pytest.raises(RuntimeError):
+                transport.send('ACQU:MEAS? -1,5')
+            t0 = time.time()
+            while transport.breaker.is_open:
+                assert time.time() - t0 < 2
+                time.sleep(0.01)
+            assert transport.send('ACQU:STAT?').startswith('STATE_')
+        finally:
+            transport.close()
+
+
+@pytest.mark.parametrize('transport_class',
+                         [AlbaEm2Transport, AsyncAlbaEm2Transport])
+def test_slow_command(transport_class):
+    """A command slower than the usual round-trip is not a timeout."""
+    with AlbaEm2Simulator() as sim:
+        transport = transport_class(sim.host, sim.port)
+        try:
+            for _ in range(20):
+                transport.send('ACQU:STAT?')
+            assert transport.stats.rtt(['ACQU:STAT?']).srtt < 0.05
+            sim.model.delays['ACQU:START'] = 0.3
+            assert transport.send('ACQU:START') == 'ACK'
+            assert transport.stats.timeouts == 0
+            assert not transport.breaker.is_open
+        finally:
+            transport.close()
+
+
+def test_hung_unit_detected_fast():
+    """A unit that stops answering the state is down after a few RTTs."""
+    with AlbaEm2Simulator() as sim:
+        transport = AlbaEm2Transport(sim.host, sim.port)
+        try:
+            for _ in range(20):
+                transport.send('ACQU:STAT?')
+            sim.model.delays['ACQU:STAT?'] = 2
+            t0 = time.time()
+            with pytest.raises(RuntimeError):
+                transport.send('ACQU:STAT?')
+            assert time.time() - t0 < 0.5
+            assert transport.breaker.is_open
+            sim.model.delays.clear()
+        finally:
+            transport.close()
+
+
+@pytest.fixture
+def mute_server():
+    """Server recording the writes, it answers only when 'answer' is set."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    server.settimeout(0.05)
+    state = {'answer': False, 'received': []}
+    done = threading.Event()
+
+    def handle(conn):
+        conn.settimeout(0.05)
+        with conn:
+            while not done.is_set():
+                try:
+                    data = conn.recv(1024)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                state['received'].append(data)
+                if state['answer']:
+                    cmds = data.decode().rstrip(';\n').split(';')
+                    conn.sendall((';'.join('ACK' for _ in cmds) +
+                                  ';\n').encode())
+
+    def serve():
+        while not done.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            threading.Thread(target=handle, args=(conn,)).start()
+
+    worker = threading.Thread(target=serve)
+    worker.start()
+    yield server.getsockname(), state
+    done.set()
+    worker.join()
+    server.close()
+
+
+def test_circuit_breaker(mute_server):
+    """A unit down fails fast and is restored in the background."""
+    address, state = mute_server
+    transport = AlbaEm2Transport(*address, timeout=0.1)
+    transport.breaker.backoff_min = 0.01
+    try:
+        # Reconnected and sent once more before giving up
+        with pytest.raises(RuntimeError):
+            transport.send('ACQU:STAT?')
+        assert state['received'].count(b'ACQU:STAT?;\n') == 2
+        assert transport.breaker.is_open
+        t0 = time.time()
+        with pytest.raises(DeviceUnavailableError):
+            transport.send('ACQU:STAT?')
+        assert time.time() - t0 < 0.05
+        state['answer'] = True
+        t0 = time.time()
+        while transport.breaker.is_open:
+            assert time.time() - t0 < 2
+            time.sleep(0.01)
+        assert transport.send('ACQU:STAT?') == 'ACK'
+    finally:
+        transport.close()
+
+
+def test_start_is_not_resent(mute_server):
+    """ACQU:START may have been executed, it is never sent twice."""
+    address, state = mute_server
+    transport = AlbaEm2Transport(*address, timeout=0.1)
+    try:
+        with pytest.raises(RuntimeError):
+            transport.send('ACQU:START')
+        assert state['received'].count(b'ACQU:START;\n') == 1
+        # Nothing answers the state either, the unit is down
+        assert transport.breaker.is_open
+    finally:
+        transport.close()
+
+
+def test_slow_start_keeps_unit_up():
+    """A start without answer fails alone if the unit still answers."""
+    with AlbaEm2Simulator() as sim:
+        transport = AlbaEm2Transport(sim.host, sim.port, timeout=0.2)
+        try:
+            sim.model.delays['ACQU:START'] = 0.5
+            with pytest.raises(RuntimeError, match='did not answer'):
+                transport.send('ACQU:START')
+            assert not transport.breaker.is_open
+            assert transport.send('ACQU:STAT?').startswith('STATE_')
+        finally:
+            transport.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Channel formulas applied to the AlbaEm2 measurements."""
+
+import ast
+
+import numpy as np
+
+__all__ = ['Formula']
+
+# Functions allowed in a formula, applied element-wise on the values.
+FUNCTIONS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'log10': np.log10,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load,
+    ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv,
+    ast.Mod, ast.Pow, ast.UAdd, ast.USub,
+)
+
+
+class Formula(object):
+    """
+    Formula to get the real value of a channel, e.g. "(value/10)*1e-06".
+
+    The expression is validated and compiled once. Calling the formula
+    evaluates it on a whole numpy array of values at once.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        expression = expression.strip().lower()
+        self._identity = expression == 'value'
+        tree = self._validate(expression)
+        self._code = compile(tree, '<formula>', 'eval')
+
+    def _validate(self, expression):
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except SyntaxError as e:
+            raise ValueError('Invalid formula %r: %s' % (self.expression, e))
+        # The functions are only allowed when called, ast.walk yields every
+        # call before its function name
+        called = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError('Invalid formula %r: %s is not allowed' % (
+                    self.expression, type(node).__name__))
+            if isinstance(node, ast.Constant) and \
+                    (isinstance(node.value, bool) or
+                     not isinstance(node.value, (int, float))):
+                raise ValueError('Invalid formula %r: only numeric '
+                                 'constants are allowed' % self.expression)
+            if isinstance(node, ast.Name) and node.id != 'value' and \
+                    node.id not in FUNCTIONS:
+                raise ValueError('Invalid formula %r: unknown name '
+                                 '%r' % (self.expression, node.id))
+            if isinstance(node, ast.Name) and node.id in FUNCTIONS and \
+                    node not in called:
+                raise ValueError('Invalid formula %r: the function %r is '
+                                 'not called' % (self.expression, node.id))
+            if isinstance(node, ast.Call) and (
+                    not isinstance(node.func, ast.Name) or
+                    node.func.id not in FUNCTIONS or node.keywords or
+                    len(node.args) != 1):
+                raise ValueError('Invalid formula %r: only the functions %s '
+                                 'are allowed' % (self.expression,
+                                                  ', '.join(sorted(FUNCTIONS))))
+            if isinstance(node, ast.Call):
+                called.add(node.func)
+        return tree
+
+    def __call__(self, values):
+        """
+        Apply the formula.
+
+        :param values: numpy array with the raw values
+        :return: numpy array with the same shape and the same type as the
+                 values if they are floats, float64 otherwise.
+        """
+        if self._identity:
+            return values
+        dtype = getattr(values, 'dtype', None)
+        if dtype is None or not np.issubdtype(dtype, np.floating):
+            dtype = np.float64
+        namespace = dict(FUNCTIONS, value=values)
+        result = eval(self._code, {'__builtins__': {}}, namespace)
+        result = np.asarray(result, dtype=dtype)
+        if result.shape != np.shape(values):
+            result = np.broadcast_to(result, np.shape(values)).copy()
+        return result
+
+    def __repr__(self):
+        return 'Formula(%r)' % self.expression
@@ -1,4 +1,6 @@
+import json
 import time
+from collections import OrderedDict
 from sardana.macroserver.macro import Macro, Type
 from taurus import Device, Attribute
 from taurus.core import AttrQuality
@@ -13,6 +15,48 @@ MAX_VALUE = 95
 INTEGRATION_TIME = 0.3
 AUTO_RANGE_TIMEOUT = 40
 
+# Controllers writing the settings of many channels with a single command
+BATCH_CONTROLLERS = ('Albaem2CoTiCtrl', 'Albaem2OneDCtrl')
+
+
+def group_by_controller(chns):
+    """
+    Group the [channel, value] pairs by the controller of the channels.
+
+    :return: list of (controller, [[channel, value], ...]), in the order of
+             the channels
+    """
+    groups = OrderedDict()
+    for ch, value in chns:
+        ctrl = ch.getControllerObj()
+        groups.setdefault(ctrl.getName(), (ctrl, []))[1].append([ch, value])
+    return list(groups.values())
+
+
+def write_channels(ctrl, command, attr, chns):
+    """
+    Write an attribute of the channels of a controller and read it back.
+
+    The AlbaEm2 controllers apply all of them in a single exchange with the
+    electrometer, the others get one write per channel.
+
+    :param command: command of the AlbaEm2 controllers, e.g. 'SetRanges'
+    :param attr: attribute of the channels, e.g. 'Range'
+    :return: list of [channel, old value, new value]
+    """
+    if ctrl.getClassName() in BATCH_CONTROLLERS:
+        values = dict((ch.getAxis(), value) for ch, value in chns)
+        stream = '%s %s' % (command, json.dumps(values))
+        pool = ctrl.getPoolObj()
+        changes = json.loads(pool.SendToController([ctrl.getName(), stream]))
+        return [[ch] + changes[str(ch.getAxis())] for ch, _ in chns]
+    result = []
+    for ch, value in chns:
+        old_value = ch.read_attribute(attr).value
+        ch.write_attribute(attr, value)
+        result.append([ch, old_value, ch.read_attribute(attr).value])
+    return result
+
 
 # class findMaxRange(Macro):
 #     """
@@ -180,13 +224,13 @@ class em_range(Macro):
                   None, 'List of [channels,range]']]
     enabled_output = True
     def run(self, chns):
-        for ch, rg in chns:
-            old_range = ch.read_attribute("Range").value
-            ch.write_attribute("Range", rg)
-            new_range = ch.read_attribute("Range").value
-            if self.enabled_output:
-                self.output('%s changed range from %s to %s' % (ch, old_range,
-                                                                new_range))
+        # All the ranges of an electrometer are changed at once
+        for ctrl, ctrl_chns in group_by_controller(chns):
+            changes = write_channels(ctrl, 'SetRanges', 'Range', ctrl_chns)
+            for ch, old_range, new_range in changes:
+                if self.enabled_output:
+                    self.output('%s changed range from %s to %s' %
+                                (ch, old_range, new_range))
 
 
 class em_inversion(Macro):
@@ -200,12 +244,13 @@ class em_inversion(Macro):
                   None, 'List of [channels, inversion]'], ]
 
     def run(self, chns):
-        for ch, enabled in chns:
-            old_state = ch.read_attribute('Inversion').value
-            ch.write_attribute('Inversion', enabled)
-            new_state = ch.read_attribute('Inversion').value
-            self.output('%s changed inversion from %s to %s' % (ch, old_state,
-                                                                new_state))
+        # All the inversions of an electrometer are changed at once
+        for ctrl, ctrl_chns in group_by_controller(chns):
+            changes = write_channels(ctrl, 'SetInversions', 'Inversion',
+                                     ctrl_chns)
+            for ch, old_state, new_state in changes:
+                self.output('%s changed inversion from %s to %s' %
+                            (ch, old_state, new_state))
 
 
 class em_autorange(Macro):
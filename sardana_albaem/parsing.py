@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Parsers for the AlbaEm2 replies."""
+
+import re
+import warnings
+
+import numpy as np
+
+__all__ = ['parse_measurements', 'parse_block', 'parse_float',
+           'parse_switch', 'channel_index']
+
+# Values of the binary blocks: IEEE 754 double, normal (big endian) order
+BLOCK_DTYPE = np.dtype('>f8')
+NB_CHANNELS = 4
+
+# Entry of the measurements with the duration of every point
+TIME_CHANNEL = 'TIME'
+
+# One channel of the ACQU:MEAS? reply: ['CHAN01', [1.0, 2.0, ...]]
+_CHANNEL = re.compile(r"\[\s*['\"]([^'\"]*)['\"]\s*,\s*\[([^\]]*)\]\s*\]")
+
+
+def _parse_values(text):
+    if not text.strip():
+        return np.empty(0, dtype=np.float64)
+    with warnings.catch_warnings():
+        # numpy only warns when the text can not be read to its end
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(text, dtype=np.float64, sep=',')
+        except (ValueError, DeprecationWarning):
+            raise ValueError('Invalid measurement values: %r' % text[:80])
+    if len(values) != text.count(',') + 1:
+        raise ValueError('Invalid measurement values: %r' % text[:80])
+    return values
+
+
+def parse_measurements(raw):
+    """
+    Parse the reply of ACQU:MEAS? without evaluating it.
+
+    :param raw: reply like "[['CHAN01', [1.0, 2.0]], ['CHAN02', [...]]]"
+    :return: list of (channel name, float64 numpy array) in reply order.
+    """
+    raw = raw.strip()
+    if not (raw.startswith('[') and raw.endswith(']')):
+        raise ValueError('Invalid measurement data: %r' % raw[:80])
+    channels = []
+    for match in _CHANNEL.finditer(raw):
+        channels.append((match.group(1), _parse_values(match.group(2))))
+    if not channels and raw[1:-1].strip():
+        raise ValueError('Invalid measurement data: %r' % raw[:80])
+    return channels
+
+
+def parse_block(payload, length, nb_channels=NB_CHANNELS):
+    """
+    Map the binary block reply of ACQU:MEAS? without copying it.
+
+    :param payload: bytes-like object with the values of every channel, one
+                    channel after the other
+    :param length: number of points per channel
+    :param nb_channels: number of channels in the reply
+    :return: list of (channel name, numpy array) views of the payload.
+    """
+    if len(payload) != nb_channels * length * BLOCK_DTYPE.itemsize:
+        raise ValueError('Invalid measurement block: %d bytes for %d points '
+                         'of %d channels' % (len(payload), length,
+                                             nb_channels))
+    values = np.frombuffer(payload, dtype=BLOCK_DTYPE)
+    return [('CHAN%02d' % (chn + 1), values[chn * length:(chn + 1) * length])
+            for chn in range(nb_channels)]
+
+
+def channel_index(name):
+    """
+    Index of an entry of the measurements: 0 for the durations of the points
+    and 1 to 4 for the channels 'CHAN01' to 'CHAN04'.
+    """
+    if name == TIME_CHANNEL:
+        return 0
+    if name.startswith('CHAN'):
+        return int(name[4:])
+    raise ValueError('Unknown measurement channel: %r' % name)
+
+
+def parse_float(raw):
+    """Parse a single numeric reply, e.g. of CHAN01:INSCurrent?"""
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid numeric reply: %r' % (raw,))
+
+
+def parse_switch(raw):
+    """
+    Parse an ON/OFF reply, e.g. of CHAN01:CABO:INVE?, or the 1/0 value of
+    the setting as written.
+    """
+    value = str(raw).strip().lower()
+    if value in ('on', '1'):
+        return True
+    if value in ('off', '0'):
+        return False
+    raise ValueError('Invalid ON/OFF reply: %r' % (raw,))
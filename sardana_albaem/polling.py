@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Polling of the state of the acquisitions and of the device values."""
+
+import time
+
+__all__ = ['StatePredictor', 'PollingCache', 'wait_for']
+
+# Time for the device to start an acquisition, in seconds
+START_TIMEOUT = 3
+# Longest time without asking the state to the device, in seconds
+MAX_INTERVAL = 1.0
+# The state is asked on every poll from this time before the expected end
+MARGIN = 0.02
+# Bounds of the delays between two checks of wait_for, in seconds
+DELAY_MIN = 0.001
+DELAY_MAX = 0.05
+
+
+def wait_for(condition, timeout, delay_min=DELAY_MIN, delay_max=DELAY_MAX):
+    """
+    Check a condition until it is true, doubling the delay between two
+    checks from delay_min to delay_max seconds.
+
+    :param condition: callable returning True once the wait is over, e.g.
+                      asking the device
+    :param timeout: time to give up, in seconds
+    :return: True if the condition became true, False after the timeout
+    """
+    deadline = time.monotonic() + timeout
+    delay = delay_min
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        if condition():
+            return True
+        delay = min(2 * delay, delay_max)
+
+
+class StatePredictor(object):
+    """
+    Tell whether a state poll has to ask the device.
+
+    While an acquisition is running it cannot be over before all its
+    triggers were integrated, nor, once points arrive, before the rest of
+    them were integrated too. The rate of the points is not used, the
+    triggers may start late, e.g. after the acceleration of a motor. Until
+    MARGIN seconds before that time the polls are answered with the last
+    state, but the device is still asked every max_interval seconds, e.g.
+    to see an abort.
+
+    :param max_interval: longest time without asking the state, in seconds.
+                         0 asks it on every poll
+    """
+
+    def __init__(self, max_interval=MAX_INTERVAL, margin=MARGIN):
+        self.max_interval = max_interval
+        self.margin = margin
+        self.reset()
+        self._armed = False
+        self._start = 0.0
+        self._integration_time = 0.0
+        self._earliest_end = 0.0
+        self._last_query = 0.0
+        self._nb_triggers = 0
+        self._ndat = 0
+        self._ndat_time = 0.0
+
+    def arm(self, start, integration_time, nb_triggers):
+        """
+        An acquisition is running.
+
+        :param start: time.monotonic() before the start was sent
+        :param integration_time: minimum time of every trigger, in seconds
+        :param nb_triggers: points of the acquisition
+        """
+        self._armed = True
+        self._start = self._last_query = start
+        self._integration_time = integration_time
+        self._earliest_end = start + integration_time * nb_triggers
+        self._nb_triggers = nb_triggers
+        self._ndat = 0
+        self._ndat_time = start
+
+    def disarm(self):
+        """The acquisition is over or aborted, every poll asks the device."""
+        self._armed = False
+
+    def progress(self, ndat, now=None):
+        """Record the points acquired, as read from the device."""
+        if self._armed and ndat > self._ndat:
+            self._ndat = ndat
+            self._ndat_time = time.monotonic() if now is None else now
+
+    def queried(self, moving, ndat=None, now=None):
+        """Record a state read from the device."""
+        now = time.monotonic() if now is None else now
+        self.queries += 1
+        self._last_query = now
+        if ndat is not None:
+            self.progress(ndat, now)
+        if not moving:
+            self.disarm()
+
+    def expected_end(self):
+        """Earliest time the acquisition can be over."""
+        remaining = self._nb_triggers - self._ndat
+        return max(self._earliest_end,
+                   self._ndat_time + remaining * self._integration_time)
+
+    def needs_query(self, now=None):
+        """
+        Return True if the state must be asked to the device, False if the
+        acquisition cannot be over yet.
+        """
+        if not self._armed or self.max_interval <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        if (now - self._last_query >= self.max_interval or
+                now >= self.expected_end() - self.margin):
+            return True
+        self.predicted += 1
+        return False
+
+    def reset(self):
+        """Clear the counters of the polls."""
+        self.queries = 0
+        self.predicted = 0
+
+    def summary(self):
+        return {'queries': self.queries, 'predicted': self.predicted}
+
+
+class PollingCache(object):
+    """
+    Value read from the device at most once every period seconds, e.g.
+    for the attributes polled by the GUIs.
+
+    :param read: callable reading the value from the device
+    :param period: time the value is served from the cache, in seconds.
+                   0 reads it on every call
+    """
+
+    def __init__(self, read, period):
+        self._read = read
+        self.period = period
+        self._value = None
+        self._time = None
+
+    def get(self):
+        now = time.monotonic()
+        if self._time is None or now - self._time >= self.period:
+            self._value = self._read()
+            self._time = now
+        return self._value
+
+    def invalidate(self):
+        """The next get reads the value from the device."""
+        self._time = None
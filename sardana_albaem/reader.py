@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Background reading of the AlbaEm2 acquisition buffer."""
+
+import logging
+from threading import Event, Lock, Thread
+
+import numpy as np
+
+__all__ = ['AcquisitionReader']
+
+# Time between two ACQU:NDAT? polls of the reader thread, in seconds
+READ_PERIOD = 0.02
+
+
+class AcquisitionReader(object):
+    """
+    Thread draining the new points of an acquisition into a local buffer.
+
+    The thread runs from :meth:`start` until the expected number of points
+    has been read, :meth:`finish` or :meth:`stop` are called. The points
+    are collected with :meth:`pop` without any access to the device.
+    """
+
+    def __init__(self, transport, chunk_size=None, period=READ_PERIOD,
+                 log=None, dtype=np.float64):
+        self._transport = transport
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self.period = period
+        self._log = log or logging.getLogger(__name__)
+        self._lock = Lock()
+        self._stop = Event()
+        self._finish = Event()
+        self._thread = None
+        self._expected = 0
+        self._index = 0
+        self._chunks = []
+        self._error = None
+
+    def start(self, expected):
+        """
+        Start reading a new acquisition.
+
+        :param expected: number of points of the acquisition
+        """
+        self.stop()
+        self._expected = expected
+        self._index = 0
+        self._chunks = []
+        self._error = None
+        self._stop.clear()
+        self._finish.clear()
+        self._thread = Thread(target=self._run, name='AlbaEm2Reader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop reading, the points not read yet are discarded."""
+        if self._thread is not None:
+            self._stop.set()
+            self._finish.set()
+            self._thread.join()
+            self._thread = None
+
+    def finish(self, timeout=None):
+        """Read the last points of a finished acquisition and stop."""
+        if self._thread is not None:
+            self._finish.set()
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                final = self._finish.is_set()
+                self._drain()
+                if final or self._index >= self._expected:
+                    break
+                self._finish.wait(self.period)
+        except Exception as e:
+            self._log.error('AlbaEm2 background read failed: %s' % e)
+            self._error = e
+
+    def _drain(self):
+        ndat = int(self._transport.send('ACQU:NDAT?'))
+        if ndat <= self._index:
+            return
+        data = self._transport.read_measurements(
+            self._index, ndat - self._index, self.chunk_size, self.dtype)
+        with self._lock:
+            self._chunks.append(data)
+            self._index = ndat
+
+    def pop(self):
+        """
+        Take the points read since the last call.
+
+        :return: list of (channel name, numpy array of dtype) with the new
+                 points, empty if there are none.
+        """
+        with self._lock:
+            chunks, self._chunks = self._chunks, []
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+        if not chunks:
+            return []
+        if len(chunks) == 1:
+            return chunks[0]
+        return [(name, np.concatenate([chunk[i][1] for chunk in chunks]))
+                for i, (name, _) in enumerate(chunks[0])]
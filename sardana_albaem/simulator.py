@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""
+TCP simulator of an AlbaEm2 electrometer.
+
+It emulates the SCPI subset used by the controllers (ACQU:*, TRIG:*, TMST,
+FORM:DATA, CHANxx:CABO:*, CHANxx:INSC? and IOPOxx:*) so they can be tested
+and benchmarked without hardware. It can run in the same process::
+
+    with AlbaEm2Simulator(trigger_rate=1000) as sim:
+        ctrl = Albaem2CoTiCtrl('test', {'AlbaEmHost': sim.host,
+                                        'Port': sim.port, ...})
+
+or as a standalone server::
+
+    python -m sardana_albaem.simulator --port 5025 --trigger-rate 1000
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+__all__ = ['AlbaEm2Simulator', 'AlbaEm2Model']
+
+RANGES = ['1mA', '100uA', '10uA', '1uA', '100nA', '10nA', '1nA', '100pA']
+NB_CHANNELS = 4
+
+
+class AlbaEm2Model(object):
+    """
+    State of the simulated electrometer.
+
+    The points of an acquisition are generated from the elapsed time since
+    ACQU:START: one every integration time with software trigger or one
+    every 1/trigger_rate seconds with hardware trigger or gate. The value of
+    the point i of the channel c is ``i + c / 10``.
+
+    With FORM:DATA REAL,64 the ACQU:MEAS? reply is an IEEE-488.2 binary
+    block with the big endian doubles of every channel, one channel after
+    the other. Older firmware is emulated with binary_blocks=False.
+    """
+
+    def __init__(self, trigger_rate=1000.0, buffer_depth=1000000,
+                 binary_blocks=True):
+        self.trigger_rate = trigger_rate
+        self.buffer_depth = buffer_depth
+        self.binary_blocks = binary_blocks
+        self.data_format = 'ASCII'
+        self.lock = threading.Lock()
+        self.acq_time = 1000.0  # ms
+        self.ntri = 1
+        self.acq_mode = 'CURRENT'
+        self.trig_mode = 'SOFTWARE'
+        self.trig_input = 'DIO_1'
+        self.tmst = 0
+        self.ranges = ['1mA'] * NB_CHANNELS
+        self.inversions = ['OFF'] * NB_CHANNELS
+        self.iopo = {}
+        self._t0 = None
+        self._stopped_ndat = 0
+        self.nb_commands = 0
+        # Execution time of some commands, e.g. {'ACQU:START': 0.3}
+        self.delays = {}
+        self._texts = [[] for _ in range(NB_CHANNELS)]
+
+    def _period(self):
+        itime = self.acq_time / 1000.0
+        if self.trig_mode == 'SOFTWARE':
+            return itime
+        return max(itime, 1.0 / self.trigger_rate)
+
+    def ndat(self):
+        if self._t0 is None:
+            return self._stopped_ndat
+        ndat = int((time.time() - self._t0) / self._period())
+        return min(ndat, self.ntri, self.buffer_depth)
+
+    def state(self):
+        if self._t0 is not None and self.ndat() < self.ntri:
+            return 'STATE_ACQUIRING'
+        return 'STATE_ON'
+
+    def complete(self):
+        """Acquire at once all the points of the running acquisition."""
+        with self.lock:
+            if self._t0 is not None:
+                self._t0 = time.time() - self._period() * self.ntri
+
+    def measurements(self, last, length):
+        first = last + 1
+        length = max(0, min(length, self.ndat() - first))
+        if self.data_format == 'REAL,64':
+            values = np.arange(first, first + length, dtype=np.float64)
+            payload = np.concatenate([values + chn / 10.0 for chn in
+                                      range(1, NB_CHANNELS + 1)])
+            payload = payload.astype('>f8').tobytes()
+            size = str(len(payload))
+            return ('#%d%s' % (len(size), size)).encode() + payload
+        # The text of the values is cached, so the simulator does not
+        # dominate the time of big reads in the benchmarks
+        for chn, texts in enumerate(self._texts, 1):
+            texts.extend(repr(i + chn / 10.0)
+                         for i in range(len(texts), first + length))
+        chans = []
+        for chn, texts in enumerate(self._texts, 1):
+            values = ', '.join(texts[first:first + length])
+            chans.append("['CHAN{0:02d}', [{1}]]".format(chn, values))
+        return '[' + ', '.join(chans) + ']'
+
+    def execute(self, cmd):
+        """Execute one command and return its answer."""
+        header, _, arg = cmd.strip().partition(' ')
+        header = header.upper()
+        arg = arg.strip()
+        delay = self.delays.get(header)
+        if delay:
+            time.sleep(delay)
+        with self.lock:
+            self.nb_commands += 1
+            try:
+                return self._execute(header, arg)
+            except (ValueError, IndexError) as e:
+                return 'ERROR: %s %s' % (header, e)
+
+    def _execute(self, header, arg):
+        if header == 'ACQU:STAT?':
+            return self.state()
+        if header == 'ACQU:NDAT?':
+            return str(self.ndat())
+        if header == 'ACQU:MEAS?':
+            last, length = [int(v) for v in arg.split(',')]
+            return self.measurements(last, length)
+        if header == 'ACQU:START':
+            self._t0 = time.time()
+            return 'ACK'
+        if header == 'ACQU:STOP':
+            self._stopped_ndat = self.ndat()
+            self._t0 = None
+            return 'ACK'
+        if header == 'ACQU:TIME':
+            self.acq_time = float(arg)
+            return 'ACK'
+        if header == 'ACQU:TIME?':
+            return repr(self.acq_time)
+        if header == 'ACQU:NTRI':
+            self.ntri = int(arg)
+            return 'ACK'
+        if header == 'ACQU:NTRI?':
+            return str(self.ntri)
+        if header == 'ACQU:MODE':
+            self.acq_mode = arg
+            return 'ACK'
+        if header == 'ACQU:MODE?':
+            return self.acq_mode
+        if header == 'TRIG:MODE':
+            self.trig_mode = arg.upper()
+            return 'ACK'
+        if header == 'TRIG:MODE?':
+            return self.trig_mode
+        if header == 'TRIG:INPU':
+            self.trig_input = arg
+            return 'ACK'
+        if header == 'TRIG:INPU?':
+            return self.trig_input
+        if header == 'FORM:DATA' and self.binary_blocks:
+            fmt = arg.upper().replace(' ', '')
+            if fmt.startswith('ASC'):
+                self.data_format = 'ASCII'
+            elif fmt == 'REAL,64':
+                self.data_format = fmt
+            else:
+                raise ValueError('unsupported format %s' % arg)
+            return 'ACK'
+        if header == 'FORM:DATA?' and self.binary_blocks:
+            return self.data_format
+        if header == 'TMST':
+            self.tmst = int(arg)
+            return 'ACK'
+        if header.startswith('CHAN'):
+            return self._channel(header, arg)
+        if header.startswith('IOPO'):
+            self.iopo[header] = arg
+            return 'ACK'
+        return 'ERROR: unknown command %s' % header
+
+    def _channel(self, header, arg):
+        chn_name, _, subcmd = header.partition(':')
+        chn = int(chn_name[4:]) - 1
+        if not 0 <= chn < NB_CHANNELS:
+            raise IndexError('channel out of range')
+        if subcmd == 'CABO:RANGE':
+            if arg not in RANGES:
+                raise ValueError('invalid range %s' % arg)
+            self.ranges[chn] = arg
+            return 'ACK'
+        if subcmd == 'CABO:RANGE?':
+            return self.ranges[chn]
+        if subcmd == 'CABO:INVE':
+            self.inversions[chn] = 'ON' if int(arg) else 'OFF'
+            return 'ACK'
+        if subcmd == 'CABO:INVE?':
+            return self.inversions[chn]
+        if subcmd.startswith('INSC') and subcmd.endswith('?'):
+            return repr((chn + 1) * 1e-9)
+        return 'ERROR: unknown command %s' % header
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        sim = self.server.simulator
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            cmds = [cmd for cmd in line.decode().strip().split(';') if cmd]
+            if not cmds:
+                continue
+            # The binary block answers are already bytes
+            answers = [sim.model.execute(cmd) for cmd in cmds]
+            reply = b';'.join(answer if isinstance(answer, bytes)
+                              else answer.encode()
+                              for answer in answers) + b';\n'
+            if sim.latency:
+                time.sleep(sim.latency)
+            self._write(reply, sim.fragment_size)
+
+    def _write(self, reply, fragment_size):
+        if not fragment_size:
+            self.wfile.write(reply)
+            return
+        for i in range(0, len(reply), fragment_size):
+            self.wfile.write(reply[i:i + fragment_size])
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class AlbaEm2Simulator(object):
+    """
+    TCP server emulating an AlbaEm2.
+
+    :param host: interface to listen on
+    :param port: port to listen on, a free one if 0
+    :param trigger_rate: hardware trigger rate in Hz
+    :param buffer_depth: maximum number of points of an acquisition
+    :param latency: delay before every reply, in seconds
+    :param fragment_size: write the replies in chunks of this many bytes
+    :param binary_blocks: support FORM:DATA REAL,64
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, trigger_rate=1000.0,
+                 buffer_depth=1000000, latency=0.0, fragment_size=None,
+                 binary_blocks=True):
+        self.model = AlbaEm2Model(trigger_rate, buffer_depth, binary_blocks)
+        self.latency = latency
+        self.fragment_size = fragment_size
+        self._server = _Server((host, port), _Handler)
+        self._server.simulator = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='AlbaEm2Simulator')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AlbaEm2 simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5025)
+    parser.add_argument('--trigger-rate', type=float, default=1000.0,
+                        help='hardware trigger rate in Hz')
+    parser.add_argument('--buffer-depth', type=int, default=1000000,
+                        help='maximum number of points per acquisition')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='delay before every reply in seconds')
+    parser.add_argument('--fragment-size', type=int, default=None,
+                        help='write the replies in chunks of this size')
+    parser.add_argument('--text-only', action='store_true',
+                        help='reject FORM:DATA, like older firmware')
+    args = parser.parse_args()
+    sim = AlbaEm2Simulator(args.host, args.port, args.trigger_rate,
+                           args.buffer_depth, args.latency,
+                           args.fragment_size, not args.text_only)
+    print('AlbaEm2 simulator listening on %s:%d' % (sim.host, sim.port))
+    try:
+        sim.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
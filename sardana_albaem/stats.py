@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""Communication statistics of the AlbaEm2 transports."""
+
+from bisect import bisect_left
+
+__all__ = ['TransportStats', 'RttEstimator', 'LATENCY_BUCKETS']
+
+# Upper bounds of the latency histogram buckets: 100 us to ~13 s. The last
+# bucket counts everything above.
+LATENCY_BUCKETS = [1e-4 * 2 ** i for i in range(18)]
+
+# Bounds of the timeouts, in seconds
+MIN_TIMEOUT = 0.1
+MAX_TIMEOUT = 60.0
+# Replies bigger than this, in bytes, estimate the transfer rate instead of
+# the round-trip time
+LARGE_REPLY = 4096
+# Transfer rate assumed until it is measured, in bytes per second
+INITIAL_RATE = 1e6
+
+
+class CommandStats(object):
+    """Latency histogram of one command type."""
+
+    __slots__ = ('count', 'total', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, latency):
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+        self.histogram[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'histogram': self.histogram}
+
+
+class RttEstimator(object):
+    """
+    Round-trip time and transfer rate estimate of a unit.
+
+    The round-trip time is smoothed as TCP does (RFC 6298) from the short
+    replies, the transfer rate from the long ones. :meth:`timeout` gives
+    the time to wait for a reply of a given size.
+
+    :param initial: timeout until the first reply, in seconds
+    """
+
+    def __init__(self, initial=1.0, min_timeout=MIN_TIMEOUT,
+                 max_timeout=MAX_TIMEOUT):
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.rate = INITIAL_RATE
+        self._backoff = 1
+
+    def update(self, rtt, received):
+        """
+        Add a measured exchange.
+
+        :param rtt: time from the write to the end of the reply, in seconds
+        :param received: bytes of the reply
+        """
+        self._backoff = 1
+        if received <= LARGE_REPLY or self.srtt is None:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        if received > LARGE_REPLY:
+            elapsed = max(rtt - self.srtt, 1e-6)
+            self.rate = 0.875 * self.rate + 0.125 * received / elapsed
+
+    def backoff(self):
+        """Double the timeouts after a timeout, until the next reply."""
+        self._backoff = min(2 * self._backoff, 64)
+
+    def timeout(self, expected=0):
+        """
+        Time to wait for a reply, in seconds.
+
+        :param expected: expected size of the reply in bytes
+        """
+        if self.srtt is None:
+            rto = self.initial
+        else:
+            rto = max(self.srtt + 4 * self.rttvar, self.min_timeout)
+        # Twice the expected transfer time, the rate is just an estimate
+        rto = rto * self._backoff + 2.0 * expected / self.rate
+        return min(rto, self.max_timeout)
+
+    def summary(self):
+        return {'srtt': self.srtt, 'rttvar': self.rttvar, 'rate': self.rate,
+                'timeout': self.timeout()}
+
+
+class TransportStats(object):
+    """
+    Counters of a transport: latency per command type, bytes, timeouts and
+    reconnections.
+
+    Recording is a few additions and a bisect, cheap enough to stay on
+    during the scans. The replies also feed a round-trip time estimate per
+    command type, see :meth:`timeout`, which is not cleared by
+    :meth:`reset`: a slow command, e.g. ACQU:START, does not make the
+    queries wait longer.
+
+    :param timeout: timeout until the first reply of a command type, in
+                    seconds
+    """
+
+    def __init__(self, timeout=1.0):
+        self.initial = timeout
+        self.rtts = {}
+        self.reset()
+
+    def reset(self):
+        self.commands = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.timeouts = 0
+        self.reconnections = 0
+
+    def record(self, cmds, latency, sent, received):
+        """
+        Record an exchange with the device.
+
+        :param cmds: list of commands sent in the exchange
+        :param latency: time until the last answer, in seconds
+        :param sent: bytes written
+        :param received: bytes read
+        """
+        key = self._key(cmds)
+        stats = self.commands.get(key)
+        if stats is None:
+            stats = self.commands[key] = CommandStats()
+        stats.record(latency)
+        self.bytes_sent += sent
+        self.bytes_received += received
+        if received:
+            self.rtt(cmds).update(latency, received)
+
+    def record_timeout(self, cmds):
+        """Record a timeout waiting for the answers of a command list."""
+        self.timeouts += 1
+        self.rtt(cmds).backoff()
+
+    def rtt(self, cmds):
+        """Return the round-trip time estimate of a command list."""
+        key = self._key(cmds)
+        rtt = self.rtts.get(key)
+        if rtt is None:
+            rtt = self.rtts[key] = RttEstimator(self.initial)
+        return rtt
+
+    def timeout(self, cmds, expected=0):
+        """
+        Time to wait for the answers of a command list, in seconds.
+
+        :param cmds: list of commands sent in the exchange
+        :param expected: expected size of the answers in bytes
+        """
+        return self.rtt(cmds).timeout(expected)
+
+    @staticmethod
+    def _key(cmds):
+        return ';'.join(cmd.split(' ', 1)[0].upper() for cmd in cmds)
+
+    def summary(self):
+        """Return all the statistics as a dictionary."""
+        commands = dict((key, stats.summary())
+                        for key, stats in list(self.commands.items()))
+        return {'commands': commands,
+                'latency_buckets': LATENCY_BUCKETS,
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'timeouts': self.timeouts,
+                'reconnections': self.reconnections,
+                'rtt': dict((key, rtt.summary())
+                            for key, rtt in list(self.rtts.items()))}
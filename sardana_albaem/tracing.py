@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""
+Tracing of the controller methods.
+
+The methods are only marked with :func:`traced`, they are not wrapped, so
+a disabled trace costs nothing. :meth:`Tracer.enable` installs the
+wrappers on the controller instance and :meth:`Tracer.disable` removes
+them::
+
+    class MyCtrl(OneDController):
+        @traced
+        def ReadOne(self, axis):
+            ...
+
+    tracer = Tracer(ctrl, ctrl._log)
+    tracer.enable(sampling=100)
+"""
+
+import time
+from functools import wraps
+
+__all__ = ['traced', 'Tracer']
+
+# Maximum length of the text of an argument or a result
+MAX_LENGTH = 200
+
+
+def traced(func):
+    """Mark a method to be traced by :class:`Tracer`."""
+    func._traced = True
+    return func
+
+
+def render(value, max_length=MAX_LENGTH):
+    """
+    Return a text of the value of at most max_length characters.
+
+    The arrays are summarized with their shape and type, so a spectrum
+    is never converted to text.
+    """
+    shape = getattr(value, 'shape', None)
+    if shape is not None:
+        return 'array(shape={0}, dtype={1})'.format(shape, value.dtype)
+    if isinstance(value, (list, tuple)):
+        # The items are rendered one by one until the text is long enough
+        items = []
+        length = 0
+        for item in value:
+            if length > max_length:
+                items.append('...({0} items)'.format(len(value)))
+                break
+            items.append(render(item, max_length))
+            length += len(items[-1]) + 2
+        return '[{0}]'.format(', '.join(items))
+    text = repr(value)
+    if len(text) > max_length:
+        text = '{0}...({1} chars)'.format(text[:max_length], len(text))
+    return text
+
+
+class Tracer(object):
+    """
+    Log the calls of the :func:`traced` methods of an object.
+
+    :param obj: object with traced methods, e.g. a controller
+    :param log: logger, the calls are logged with the debug level
+    """
+
+    def __init__(self, obj, log):
+        self._obj = obj
+        self._log = log
+        self.sampling = 1
+        self.max_length = MAX_LENGTH
+        self._installed = []
+
+    @property
+    def enabled(self):
+        return bool(self._installed)
+
+    def enable(self, sampling=1, max_length=MAX_LENGTH):
+        """
+        Start tracing.
+
+        :param sampling: trace one every sampling calls of each method
+        :param max_length: maximum length of the text of every argument
+        """
+        self.sampling = max(1, int(sampling))
+        self.max_length = max_length
+        if self.enabled:
+            return
+        for name in self._traced_names():
+            # Methods replaced on the instance are left alone
+            if name not in self._obj.__dict__:
+                setattr(self._obj, name, self._wrap(getattr(self._obj, name)))
+                self._installed.append(name)
+
+    def disable(self):
+        """Stop tracing, the original methods are called again."""
+        for name in self._installed:
+            self._obj.__dict__.pop(name, None)
+        self._installed = []
+
+    def _traced_names(self):
+        cls = type(self._obj)
+        return [name for name in dir(cls)
+                if getattr(getattr(cls, name, None), '_traced', False)]
+
+    def _wrap(self, method):
+        tracer = self
+        log = self._log
+        name = method.__name__
+        calls = [0]
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            calls[0] += 1
+            if calls[0] % tracer.sampling:
+                return method(*args, **kwargs)
+            max_length = tracer.max_length
+            log.debug('Entering %s with args=(%s), kwargs={%s}', name,
+                      ', '.join(render(arg, max_length) for arg in args),
+                      ', '.join('%s: %s' % (k, render(v, max_length))
+                                for k, v in kwargs.items()))
+            t0 = time.perf_counter()
+            try:
+                output = method(*args, **kwargs)
+            except Exception as e:
+                log.debug('Leaving %s with error %s after %.6f s', name,
+                          render(e, max_length), time.perf_counter() - t0)
+                raise
+            log.debug('Leaving without error %s with output %s after %.6f s',
+                      name, render(output, max_length),
+                      time.perf_counter() - t0)
+            return output
+        return wrapper
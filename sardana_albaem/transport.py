@@ -0,0 +1,650 @@
+#!/usr/bin/env python
+
+###############################################################################
+#     albaem
+#
+#     Copyright (C) 2019  MAX IV Laboratory, Lund Sweden.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see [http://www.gnu.org/licenses/].
+###############################################################################
+
+"""SCPI socket transport shared by the AlbaEm2 controllers."""
+
+import logging
+import socket
+import time
+from functools import partial
+from threading import Lock
+
+import numpy as np
+
+from sardana_albaem.breaker import CircuitBreaker, DeviceUnavailableError
+from sardana_albaem.parsing import BLOCK_DTYPE, NB_CHANNELS, parse_block, \
+    parse_float, parse_measurements
+from sardana_albaem.polling import PollingCache
+from sardana_albaem.stats import TransportStats
+
+__all__ = ['AlbaEm2Transport', 'LineReader', 'split_answers',
+           'is_idempotent', 'is_error']
+
+TERMINATOR = b'\n'
+BLOCK_START = ord('#')
+
+# Commands with side effects if executed twice, never resent after a
+# failure since the device may have executed them already
+NON_IDEMPOTENT = ('ACQU:START', 'TRIG:SWSE')
+
+# Bytes per value of the ACQU:MEAS? text replies, e.g. '123.45678901234567, '
+TEXT_VALUE_SIZE = 26
+
+# Default maximum number of points per ACQU:MEAS? command
+MAX_CHUNK_POINTS = 10000
+
+# Settings read in bulk, and how long their values are kept in seconds
+SETTINGS = ['ACQU:MODE?'] + [
+    'CHAN{0:02d}:CABO:{1}?'.format(chn, name)
+    for name in ('RANGE', 'INVE') for chn in range(1, NB_CHANNELS + 1)]
+SETTINGS_PERIOD = 10
+
+# Default time the instant currents are cached, in seconds
+INSTANT_CURRENT_PERIOD = 0.5
+
+
+def split_answers(data):
+    """Split a reply line into the ';' terminated answers it contains."""
+    data = data.rstrip('\r')
+    if data.endswith(';'):
+        data = data[:-1]
+    return data.split(';')
+
+
+def is_error(answer):
+    """Whether an answer of the device reports an error."""
+    return isinstance(answer, str) and answer.upper().startswith('ERROR')
+
+
+def is_idempotent(cmds):
+    """Whether the list of commands can be safely sent again."""
+    return not any(cmd.strip().upper().startswith(NON_IDEMPOTENT)
+                   for cmd in cmds)
+
+
+class LineReader(object):
+    """
+    Buffered reader of '\\n' terminated replies.
+
+    The socket is read with recv_into into a reusable bytearray, so a reply
+    split in many TCP segments is neither concatenated nor decoded chunk by
+    chunk. Only the bytes received in the last recv are scanned for the
+    terminator and only the complete reply is decoded.
+    """
+
+    def __init__(self, size=8096):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        # [_start:_end] holds bytes received and not yet consumed.
+        self._start = 0
+        self._end = 0
+        # Total number of bytes received
+        self.nbytes = 0
+
+    def clear(self):
+        """Drop any pending bytes, e.g. after a reconnection."""
+        self._start = 0
+        self._end = 0
+
+    def _reserve(self):
+        # Make room at the end of the buffer for the next recv_into. The
+        # pending bytes are moved to the front and, when they already fill
+        # most of the buffer, it is doubled so the amortized cost stays
+        # linear in the reply size. A new buffer is allocated instead of
+        # extending it, the last block returned may still be referenced.
+        pending = self._end - self._start
+        if len(self._buf) - pending < len(self._buf) // 4:
+            buf = bytearray(2 * len(self._buf))
+            buf[:pending] = self._view[self._start:self._end]
+            self._buf = buf
+            self._view = memoryview(buf)
+        elif self._start > 0:
+            self._view[:pending] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def _recv(self, sock):
+        # Append the next bytes of the socket, False if the peer closed the
+        # connection.
+        if self._end == len(self._buf):
+            self._reserve()
+        n = sock.recv_into(self._view[self._end:])
+        if n == 0:
+            self.clear()
+            return False
+        self._end += n
+        self.nbytes += n
+        return True
+
+    def _find_terminator(self, sock, offset):
+        # Index of the first terminator found after _start + offset
+        while True:
+            idx = self._buf.find(TERMINATOR, self._start + offset, self._end)
+            if idx >= 0:
+                return idx
+            offset = max(offset, self._end - self._start)
+            if not self._recv(sock):
+                return None
+
+    def readline(self, sock):
+        """
+        Read one reply from the socket.
+
+        :param sock: connected socket
+        :return: decoded reply without the terminator or None if the peer
+                 closed the connection.
+        :raise: UnicodeDecodeError if the reply is not text
+        """
+        idx = self._find_terminator(sock, 0)
+        if idx is None:
+            return None
+        try:
+            line = str(self._view[self._start:idx], 'utf-8')
+        except UnicodeDecodeError:
+            # Not a text reply, e.g. a binary block: the stream is out of
+            # sync and the pending bytes are dropped
+            self.clear()
+            raise
+        self._start = idx + 1
+        if self._start == self._end:
+            self.clear()
+        return line
+
+    def read_block(self, sock):
+        """
+        Read one IEEE-488.2 definite-length block reply, e.g. '#15hello;\\n'.
+
+        The payload is not copied: the memoryview returned points into the
+        reader buffer and is only valid until the next read.
+
+        :param sock: connected socket
+        :return: memoryview of the payload, the decoded reply if it is not a
+                 block (e.g. an error message) or None if the peer closed
+                 the connection.
+        """
+        while self._end - self._start < 2:
+            if not self._recv(sock):
+                return None
+        if self._buf[self._start] != BLOCK_START:
+            return self.readline(sock)
+        ndigits = self._buf[self._start + 1] - ord('0')
+        if not 1 <= ndigits <= 9:
+            raise ValueError('Invalid block header: only definite-length '
+                             'blocks are supported')
+        while self._end - self._start < 2 + ndigits:
+            if not self._recv(sock):
+                return None
+        header = 2 + ndigits
+        size = int(self._buf[self._start + 2:self._start + header])
+        # The payload may contain the terminator, look for it afterwards
+        idx = self._find_terminator(sock, header + size)
+        if idx is None:
+            return None
+        first = self._start + header
+        payload = self._view[first:first + size]
+        self._start = idx + 1
+        if self._start == self._end:
+            self.clear()
+        return payload
+
+
+class AlbaEm2Transport(object):
+    """
+    Socket connection to an AlbaEm2 electrometer.
+
+    Every command is terminated with ';\\n' and, when an answer is
+    requested, the reply line is read back with :class:`LineReader`.
+    In case of a socket timeout the connection is re-created and the
+    command is sent again.
+
+    When an exchange fails the connection is re-created and, only if all
+    the commands are idempotent, they are sent once more. If that fails
+    too the unit is considered down: :attr:`breaker` fails the next
+    commands at once while the connection is restored in the background.
+
+    The last value written for each setting (e.g. 'ACQU:TIME 100.0') is kept
+    as a shadow register, so :meth:`configure` only sends the settings that
+    changed. :meth:`read_settings` fills them with the values of the
+    device and :meth:`cached` returns them without any round-trip. The
+    shadow registers are dropped whenever the socket is re-created since
+    the device may have been restarted meanwhile. :meth:`setting` keeps
+    them filled with SETTINGS, read in bulk every :attr:`settings` period.
+    The instant currents of the four channels are read at once and kept
+    for the :attr:`instant_currents` period.
+
+    The latency of every exchange, the bytes transferred, the timeouts and
+    the reconnections are recorded in :attr:`stats`. The timeout of every
+    exchange is derived from the round-trip time measured for the same
+    commands and the size of the reply expected, see
+    :class:`~sardana_albaem.stats.RttEstimator`; :attr:`timeout` is only
+    used until their first reply and to connect.
+
+    When :attr:`binary` is set the measurements are requested as IEEE-488.2
+    binary blocks (FORM:DATA REAL,64), if the firmware does not accept it
+    they are read as text.
+    """
+
+    def __init__(self, host, port, timeout=1, log=None, binary=True):
+        self.ip_config = (host, port)
+        self.timeout = timeout
+        self.binary = binary
+        self._log = log or logging.getLogger(__name__)
+        self._reader = LineReader()
+        self._shadow = {}
+        # Format of the measurements selected in this connection, None
+        # until selected, and whether the firmware sends binary blocks
+        self._data_format = None
+        self._binary_supported = False
+        self.stats = TransportStats(timeout)
+        # Snapshots of the settings, kept in the shadow registers, and of
+        # the instant currents
+        self.settings = PollingCache(partial(self.read_settings, SETTINGS),
+                                     SETTINGS_PERIOD)
+        self.instant_currents = PollingCache(self.read_instant_currents,
+                                             INSTANT_CURRENT_PERIOD)
+        self.breaker = CircuitBreaker(self._probe, '%s:%s' % (host, port),
+                                      log=self._log)
+        self.lock = Lock()
+        self.socket = None
+        self._connected = False
+        self.connect()
+
+    def connect(self):
+        """Create a new socket connected to the device."""
+        self._disconnect()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.ip_config)
+        except socket.error:
+            sock.close()
+            raise
+        self.socket = sock
+        if self._connected:
+            self.stats.reconnections += 1
+        self._connected = True
+        self._reader.clear()
+        self.invalidate()
+
+    def _disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except socket.error:
+                pass
+            self.socket = None
+
+    def invalidate(self):
+        """Forget the values written to the device."""
+        self._shadow = {}
+        self._data_format = None
+
+    def close(self):
+        self.breaker.stop()
+        self._disconnect()
+
+    def send(self, cmd, rw=True, expected=0):
+        """
+        Send a command and return its answer.
+
+        :param cmd: SCPI command without terminator
+        :param rw: read the answer of the device
+        :param expected: expected size of the answer in bytes, to wait
+                         longer for big ones
+        :return: answer of the device without the ';' terminator, None if
+                 the device closed the connection.
+        """
+        answers = self._exchange([cmd], rw, expected=expected)
+        if not answers:
+            return None
+        # NOTE: EM MAY ANSWER WITH MULTIPLE ANSWERS IN CASE OF AN
+        # EXCEPTION
+        # SIMPLY GET THE LAST ONE
+        return answers[-1]
+
+    def send_many(self, cmds, rw=True):
+        """
+        Send a list of commands in a single write and collect the answers.
+
+        The commands are joined with ';' as the firmware accepts command
+        lists, so the whole list costs one round-trip.
+
+        :param cmds: list of SCPI commands without terminator
+        :param rw: read the answers of the device
+        :return: list with one answer per command, None if the device closed
+                 the connection.
+        """
+        if not cmds:
+            return []
+        return self._exchange(cmds, rw)
+
+    def read_measurements(self, start, count, chunk_size=None,
+                          dtype=np.float64):
+        """
+        Read the measurements of all channels with ACQU:MEAS?
+
+        The points are requested in successive commands of at most
+        chunk_size points and copied into preallocated arrays, so the
+        memory used by a reply and the time the connection is locked stay
+        bounded no matter how many points are pending.
+
+        :param start: index of the first point to read
+        :param count: number of points to read
+        :param chunk_size: maximum number of points per command, all of
+                           them in a single command if None or 0.
+        :param dtype: type of the arrays returned, the values are converted
+                      while copied into them
+        :return: list of (channel name, numpy array) in reply order.
+        """
+        chunk_size = chunk_size or count
+        binary = self._check_binary()
+        names = []
+        arrays = []
+        done = 0
+        while done < count:
+            length = min(chunk_size, count - done)
+            # The device expects the index of the last point already read
+            cmd = 'ACQU:MEAS? %r,%r' % (start + done - 1, length)
+            if binary:
+                expected = length * NB_CHANNELS * BLOCK_DTYPE.itemsize
+                answers = self._exchange([cmd], True, binary=True,
+                                         expected=expected)
+                raw = answers[-1] if answers else None
+            else:
+                expected = length * NB_CHANNELS * TEXT_VALUE_SIZE
+                raw = self.send(cmd, expected=expected)
+            if raw is None:
+                raise RuntimeError('Connection closed while reading the '
+                                   'measurements')
+            if isinstance(raw, str):
+                data = parse_measurements(raw)
+            else:
+                data = parse_block(raw, length)
+            if not arrays:
+                names = [name for name, _ in data]
+                arrays = [np.empty(count, dtype) for _ in data]
+            for array, (name, values) in zip(arrays, data):
+                if len(values) != length:
+                    raise RuntimeError('%s: expected %d points, received '
+                                       '%d' % (name, length, len(values)))
+                array[done:done + length] = values
+            done += length
+        return list(zip(names, arrays))
+
+    def _check_binary(self):
+        # Select once per connection the format of the measurements. ASCII
+        # is selected too, an earlier session may have left the device
+        # sending binary blocks. The firmware versions without FORM:DATA
+        # answer an error and always send text.
+        data_format = 'REAL,64' if self.binary else 'ASCII'
+        if self._data_format != data_format:
+            answer = self.send('FORM:DATA %s' % data_format)
+            self._data_format = data_format
+            self._binary_supported = self.binary and answer is not None \
+                and answer.strip().upper() == 'ACK'
+            if self.binary and not self._binary_supported:
+                self._log.debug('Binary blocks not supported (%s), reading '
+                                'the measurements as text' % answer)
+        return self._binary_supported
+
+    def configure(self, cmds):
+        """
+        Write settings to the device skipping the ones already written.
+
+        :param cmds: list of SCPI set commands, e.g. ['ACQU:TIME 100.0']
+        :return: list with the answers of the commands actually sent.
+        """
+        pending = []
+        for cmd in cmds:
+            header, value = self._split_setting(cmd)
+            if header is None or self._shadow.get(header) != value:
+                pending.append(cmd)
+        if not pending:
+            return []
+        return self.send_many(pending)
+
+    def read_settings(self, queries):
+        """
+        Ask settings to the device in a single round-trip and keep their
+        values in the shadow registers, see :meth:`cached`.
+
+        :param queries: list of SCPI queries, e.g. ['CHAN01:CABO:RANGE?']
+        :return: list with the answers, None if the device closed the
+                 connection.
+        """
+        answers = self.send_many(queries)
+        if answers and len(answers) != len(queries):
+            # A failed query added answers that cannot be matched to the
+            # queries, they are asked one by one
+            answers = [self.send(query) for query in queries]
+        if answers:
+            for query, answer in zip(queries, answers):
+                if answer is not None and not is_error(answer):
+                    self._shadow[self._setting_header(query)] = answer
+        return answers
+
+    def cached(self, query):
+        """
+        Return the last value written or read of a setting, None if it is
+        unknown, e.g. after a reconnection.
+
+        :param query: SCPI query, e.g. 'CHAN01:CABO:RANGE?'
+        """
+        return self._shadow.get(self._setting_header(query))
+
+    def setting(self, query):
+        """
+        Return the value of a setting, usually without any round-trip.
+
+        The shadow registers are filled with SETTINGS after the period of
+        :attr:`settings` or a reconnection. The other settings, or the ones
+        the device did not answer in bulk, are asked alone.
+
+        :param query: SCPI query, e.g. 'CHAN01:CABO:RANGE?'
+        """
+        self.settings.get()
+        value = self.cached(query)
+        if value is None:
+            self.settings.invalidate()
+            self.settings.get()
+            value = self.cached(query)
+        if value is None:
+            # Not answered in bulk, e.g. an error of the device
+            value = self.send(query)
+        return value
+
+    def write_channels(self, setting, values):
+        """
+        Write a setting of many channels and read it back in a single
+        exchange.
+
+        :param setting: 'RANGE' or 'INVE'
+        :param values: dictionary {channel: value to write}, channels from 1
+        :return: dictionary {channel: [old value, new value]} as answered by
+                 the device
+        :raise: ValueError if the device refused any of the values
+        """
+        channels = sorted(values)
+        queries = ['CHAN{0:02d}:CABO:{1}?'.format(chn, setting)
+                   for chn in channels]
+        writes = ['%s %s' % (query[:-1], values[chn])
+                  for query, chn in zip(queries, channels)]
+        # The old values from the shadow registers, usually without any
+        # round-trip
+        old = [self.setting(query) for query in queries]
+        answers = self.send_many(writes + queries)
+        if answers is None:
+            raise RuntimeError('Connection closed by the device')
+        if len(answers) == len(writes) + len(queries):
+            errors = ['%s: %s' % (cmd, answer)
+                      for cmd, answer in zip(writes, answers)
+                      if is_error(answer)]
+            new = answers[len(writes):]
+        else:
+            # A failed command added answers, they cannot be matched to the
+            # commands and the values are read back one by one
+            errors = [answer for answer in answers if is_error(answer)]
+            new = None
+        if errors:
+            raise ValueError('; '.join(errors))
+        if new is None:
+            new = [self.send(query) for query in queries]
+        return dict((chn, [old_value, new_value])
+                    for chn, old_value, new_value in zip(channels, old, new))
+
+    def read_instant_currents(self):
+        """
+        Read the instant currents of the four channels in a single
+        round-trip, see :attr:`instant_currents` for the cached ones.
+
+        :return: list with the current of every channel
+        """
+        cmds = ['CHAN{0:02d}:INSCurrent?'.format(chn)
+                for chn in range(1, NB_CHANNELS + 1)]
+        answers = self.send_many(cmds)
+        if answers is not None and len(answers) != len(cmds):
+            # A failed query added answers, they are asked one by one
+            answers = [self.send(cmd) for cmd in cmds]
+        answers = answers or [None] * len(cmds)
+        return [parse_float(answer) for answer in answers]
+
+    @staticmethod
+    def _setting_header(query):
+        return query.strip().rstrip('?').upper()
+
+    @staticmethod
+    def _split_setting(cmd):
+        header, _, value = cmd.strip().partition(' ')
+        if not value or header.endswith('?'):
+            return None, None
+        return header.upper(), value.strip()
+
+    def _update_shadow(self, cmds, answers):
+        # The settings refused by the device are not kept. If the answers
+        # cannot be matched to the commands the settings are unknown.
+        unknown = answers is not None and len(answers) != len(cmds)
+        answers = answers or [None] * len(cmds)
+        for cmd, answer in zip(cmds, answers):
+            header, value = self._split_setting(cmd)
+            if header is None:
+                continue
+            if unknown:
+                self._shadow.pop(header, None)
+            elif not is_error(answer):
+                self._shadow[header] = value
+
+    def _exchange(self, cmds, rw, binary=False, expected=0):
+        # Fail fast, without waiting for the lock, if the unit is down
+        self.breaker.check()
+        with self.lock:
+            try:
+                answers = self._transfer(cmds, rw, binary, expected)
+            except DeviceUnavailableError:
+                raise
+            except (socket.error, RuntimeError):
+                # A command sent only once, e.g. ACQU:START, may just be slow:
+                # if the unit answers the command failed, not the unit
+                if not is_idempotent(cmds) and self._check_alive():
+                    raise RuntimeError('AlbaEm2 %s:%s did not answer %s' % (
+                        self.ip_config + (';'.join(cmds),)))
+                self.breaker.trip()
+                raise
+            if answers is not None or not rw:
+                self._update_shadow(cmds, answers)
+            return answers
+
+    def _probe(self):
+        # Health probe of the breaker
+        with self.lock:
+            return self._check_alive()
+
+    def _check_alive(self):
+        # Reconnect and ask the state, the caller holds the lock
+        try:
+            self.connect()
+            return self._transfer(['ACQU:STAT?'], True, False, 0) is not None
+        except (socket.error, RuntimeError) as e:
+            self._log.debug('AlbaEm2 %s:%s not alive: %s' %
+                            (self.ip_config + (e,)))
+            return False
+
+    def _transfer(self, cmds, rw, binary, expected):
+        t0 = time.perf_counter()
+        received = self._reader.nbytes
+        cmd = ';'.join(cmds)
+        raw = (cmd + ';\n').encode()
+        # A broken connection is re-created once, but the commands are only
+        # sent again if the device can execute them twice.
+        attempts = 2 if is_idempotent(cmds) else 1
+        for attempt in range(attempts):
+            try:
+                if self.socket is None:
+                    self.connect()
+                self.socket.settimeout(self.stats.timeout(cmds, expected))
+                self.socket.sendall(raw)
+                if not rw:
+                    answers = None
+                elif binary:
+                    answers = self._read_block()
+                else:
+                    answers = self._read_answers(len(cmds))
+                break
+            except socket.timeout:
+                self._log.debug('Socket timeout with %s' % cmd)
+                self.stats.record_timeout(cmds)
+                self._disconnect()
+            except (socket.error, ValueError) as e:
+                # A reply that cannot be decoded leaves the stream out of
+                # sync, like a broken connection
+                self._log.debug('Socket error with %s: %s' % (cmd, e))
+                self._disconnect()
+        else:
+            msg = "Unable to communicate with AlbaEm2, try to " \
+                  "restart the Device"
+            raise RuntimeError(msg)
+
+        if rw and answers is None:
+            self._log.error('Connection closed by the device while '
+                            'reading %s' % cmd)
+            self._disconnect()
+        self.stats.record(cmds, time.perf_counter() - t0, len(raw),
+                          self._reader.nbytes - received)
+        return answers
+
+    def _read_answers(self, nb_answers):
+        # The answers of a command list may come in one or several lines,
+        # each answer terminated by ';'.
+        answers = []
+        while len(answers) < nb_answers:
+            data = self._reader.readline(self.socket)
+            if data is None:
+                return None
+            answers.extend(split_answers(data))
+        return answers
+
+    def _read_block(self):
+        # The answer of a single command sent with binary blocks enabled
+        data = self._reader.read_block(self.socket)
+        if data is None:
+            return None
+        if isinstance(data, str):
+            return split_answers(data)
+        return [data]
@@ -41,7 +41,7 @@ def main():
     packages = find_packages()
 
     # Add your dependencies in the following line.
-    install_requires = ['sardana']
+    install_requires = ['sardana', 'numpy']
 
     setup(
         name=name,